@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Streaming aggregation of results
+================================
+Running statistics which are updated with every new result in O(1)
+time and memory: Welford's algorithm for the mean and the variance,
+min/max and the P-square algorithm (Jain and Chlamtac, 1985) for
+quantiles which only stores the first 100 values (exact quantiles for
+small samples) and then five markers.
+
+    averages = Aggregator()
+    averages.update(("swt_detector", "einthoven_ii", "sitting"), jmx)
+    averages.mean(("swt_detector", "einthoven_ii", "sitting"), "jmx")
+
+The Aggregator keeps the statistics of the values jitter, accuracy and
+jmx (or any other names) per key, for example detector/lead/experiment.
+Values which are False, None or NaN (no beats) are skipped.
+"""
+
+import math
+import bisect
+
+
+class P2Quantile:
+    """
+    Streaming estimate of the quantile p with five markers. The first
+    'exact' values are kept so that small samples get the exact quantile
+    and the markers start from their quantiles.
+    """
+
+    def __init__(self, p, exact = 100):
+        self.p = p
+        self.exact = exact
+        self.values = [] # sorted values until the markers take over
+        self.q = None # marker heights
+        self.n = None # marker positions
+        self.np = None # desired marker positions
+        self.dn = [0, p/2, p, (1+p)/2, 1]
+
+    def start_markers(self):
+        v = self.values
+        m = len(v) - 1
+        self.np = [0, m*self.p/2, m*self.p, m*(1+self.p)/2, m]
+        # distinct positions so that the markers can be interpolated
+        self.n = [int(round(x)) for x in self.np]
+        for i in range(1, 4):
+            self.n[i] = min(max(self.n[i], self.n[i-1] + 1), m - 4 + i)
+        self.q = [v[i] for i in self.n]
+        self.values = None
+
+    def add(self, x):
+        if self.values is not None:
+            bisect.insort(self.values, x)
+            if len(self.values) > self.exact:
+                self.start_markers()
+            return
+
+        q = self.q
+        n = self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k+1]:
+                k += 1
+        for i in range(k+1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        # moves the middle markers to their desired positions
+        for i in range(1, 4):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # piecewise parabolic prediction
+                qp = q[i] + d / (n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + d) * (q[i+1] - q[i]) / (n[i+1] - n[i]) +
+                    (n[i+1] - n[i] - d) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+                if not q[i-1] < qp < q[i+1]:
+                    # linear prediction
+                    qp = q[i] + d * (q[i+d] - q[i]) / (n[i+d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        if self.values is None:
+            return self.q[2]
+        if len(self.values) == 0:
+            return math.nan
+        # exact (linear interpolation as np.percentile)
+        h = (len(self.values) - 1) * self.p
+        lo = math.floor(h)
+        hi = min(lo + 1, len(self.values) - 1)
+        return self.values[lo] + (h - lo) * (self.values[hi] - self.values[lo])
+
+
+class RunningStats:
+    """Count, mean, standard deviation (as np.std), min, max and quantiles of one value."""
+
+    def __init__(self, quantiles = (0.5, 0.95)):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {p : P2Quantile(p) for p in quantiles}
+
+    def add(self, x):
+        x = float(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        for q in self.quantiles.values():
+            q.add(x)
+
+    def var(self):
+        return self.m2 / self.count if self.count > 0 else math.nan
+
+    def std(self):
+        return math.sqrt(self.var())
+
+    def quantile(self, p):
+        return self.quantiles[p].value()
+
+
+class Aggregator:
+    """RunningStats of several values per key."""
+
+    def __init__(self, names = ("jitter", "accuracy", "jmx"), quantiles = (0.5, 0.95)):
+        self.names = names
+        self.quantiles = quantiles
+        self.stats = {}
+
+    def update(self, key, values):
+        """Adds the values (dict name -> value, other names are ignored) of a result."""
+        if key not in self.stats:
+            self.stats[key] = {name : RunningStats(self.quantiles) for name in self.names}
+        for name in self.names:
+            v = values.get(name)
+            if v is None or v is False or math.isnan(v):
+                continue
+            self.stats[key][name].add(v)
+
+    def keys(self):
+        return self.stats.keys()
+
+    def get(self, key, name):
+        return self.stats[key][name]
+
+    def mean(self, key, name):
+        return self.stats[key][name].mean if self.stats[key][name].count > 0 else math.nan
+
+    def print_summary(self, name):
+        """One line per key with the statistics of a value (nothing if there are none)."""
+        if not any(stats[name].count > 0 for stats in self.stats.values()):
+            return
+        print("{:60s} {:>5s} {:>10s} {:>10s}".format(name, "n", "mean", "std") +
+              "".join(" {:>10s}".format("p{:g}".format(p * 100)) for p in self.quantiles))
+        for key, stats in self.stats.items():
+            s = stats[name]
+            if s.count == 0:
+                continue
+            label = ", ".join(str(k) for k in key) if isinstance(key, tuple) else str(key)
+            print("{:60s} {:5d} {:10.4f} {:10.4f}".format(label, s.count, s.mean, s.std()) +
+                  "".join(" {:10.4f}".format(s.quantile(p)) for p in self.quantiles))
+        print()
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Binary file of the per beat results
+===================================
+Stores jmx_analysis.beat_details() of every (detector, lead, experiment,
+subject) in a single file which is read with a memory map, so that
+per beat analyses don't need to run the detectors again:
+
+    beats = beat_file.BeatFile("results/beats.bin")
+    d = beats.get("swt_detector", "einthoven_ii", "jogging", 3)
+    d["offset"], d["missed"], ... # int32 arrays straight from the file
+
+Layout (little endian, every block starts at a multiple of 64 bytes):
+
+    file header: "JMXBEATS", version
+    record:      "BEAT", key length, number of pairs, missed and extra
+                 key (json [detector, lead, experiment, subject])
+                 anno_index, det_index, offset (one per pair), missed, extra
+    ...
+    index:       json {key : record position} and the trailer
+                 "JMXINDEX" + position of the index
+
+Records are only appended and synced to disk when they are written
+(before the task goes into the checkpoint). A run which is continued
+appends to the file and writes a new index when it's closed. If the
+index is missing (killed run) the records are found by scanning the
+file.
+"""
+
+import os
+import json
+import struct
+import numpy as np
+
+magic = b"JMXBEATS"
+version = 1
+record_magic = b"BEAT"
+index_magic = b"JMXINDEX"
+alignment = 64
+
+file_header = struct.Struct("<8sI")
+record_header = struct.Struct("<4sIIII")
+trailer = struct.Struct("<8sQ")
+
+# arrays of a record: name -> count (0: pairs, 1: missed, 2: extra)
+arrays = [("anno_index", 0), ("det_index", 0), ("offset", 0), ("missed", 1), ("extra", 2)]
+
+
+def padded(n):
+    return n + (-n % alignment)
+
+
+def key_text(detectorname, record_lead, experiment, subject_number):
+    return json.dumps([detectorname, record_lead, experiment, subject_number])
+
+
+def scan(buffer):
+    """Index (key -> record position) and end of the last complete record."""
+    index = {}
+    pos = alignment
+    while pos + record_header.size <= len(buffer):
+        tag, key_length, n_pairs, n_missed, n_extra = record_header.unpack_from(buffer, pos)
+        if tag != record_magic:
+            break
+        end = pos + alignment + padded(key_length) + sum(padded(4 * n) for n in (n_pairs, n_pairs, n_pairs, n_missed, n_extra))
+        if end > len(buffer):
+            break # cut off
+        key = bytes(buffer[pos + alignment : pos + alignment + key_length]).decode()
+        index[key] = pos
+        pos = end
+    return index, pos
+
+
+def read_index(buffer):
+    """Index from the end of the file or by scanning the records. Returns the index and the end of the records."""
+    if len(buffer) >= alignment + trailer.size:
+        tag, index_pos = trailer.unpack_from(buffer, len(buffer) - trailer.size)
+        if tag == index_magic:
+            index = json.loads(bytes(buffer[index_pos : len(buffer) - trailer.size]).decode())
+            return index, index_pos
+    return scan(buffer)
+
+
+class BeatWriter:
+    """Appends records to a beat file (new or of an unfinished run)."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index = {}
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            with open(filename,"rb") as f:
+                buffer = f.read()
+            if file_header.unpack_from(buffer)[0] != magic:
+                raise ValueError(filename + " is not a beat file")
+            self.index, end = read_index(buffer)
+            self.f = open(filename,"r+b")
+            self.f.truncate(end) # the old index is written again
+            self.f.seek(end)
+        else:
+            self.f = open(filename,"wb")
+            self.f.write(file_header.pack(magic, version).ljust(alignment, b"\0"))
+
+    def write(self, task, details):
+        """
+        Appends the beat_details() of the task (detectorname, lead, experiment, subject)
+        and syncs it to disk.
+        """
+        key = key_text(*task).encode()
+        counts = (len(details["anno_index"]), len(details["missed"]), len(details["extra"]))
+        pos = self.f.tell()
+        self.f.write(record_header.pack(record_magic, len(key), *counts).ljust(alignment, b"\0"))
+        self.f.write(key.ljust(padded(len(key)), b"\0"))
+        for name, count in arrays:
+            a = np.ascontiguousarray(details[name], dtype="<i4")
+            self.f.write(a.tobytes().ljust(padded(a.nbytes), b"\0"))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.index[key.decode()] = pos
+
+    def close(self):
+        """Writes the index. The file is complete without it but needs to be scanned."""
+        pos = self.f.tell()
+        self.f.write(json.dumps(self.index).encode())
+        self.f.write(trailer.pack(index_magic, pos))
+        self.f.close()
+
+
+class BeatFile:
+    """Memory mapped beat file (the index is rebuilt by scanning if it's missing)."""
+
+    def __init__(self, filename):
+        self.buffer = np.memmap(filename, dtype=np.uint8, mode="r")
+        if file_header.unpack_from(self.buffer)[0] != magic:
+            raise ValueError(filename + " is not a beat file")
+        self.index = read_index(self.buffer)[0]
+
+    def keys(self):
+        """All (detectorname, lead, experiment, subject) in the file."""
+        return [tuple(json.loads(k)) for k in self.index]
+
+    def get(self, detectorname, record_lead, experiment, subject_number):
+        """Dict of int32 arrays (views of the file) or None if the task isn't in the file."""
+        pos = self.index.get(key_text(detectorname, record_lead, experiment, subject_number))
+        if pos is None:
+            return None
+        tag, key_length, *counts = record_header.unpack_from(self.buffer, pos)
+        pos += alignment + padded(key_length)
+        details = {}
+        for name, count in arrays:
+            n = counts[count]
+            details[name] = np.frombuffer(self.buffer, dtype="<i4", count=n, offset=pos)
+            pos += padded(4 * n)
+        return details
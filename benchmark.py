@@ -0,0 +1,351 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Recording-major evaluation engine
+=================================
+Every (subject, experiment) recording is loaded only once and then all
+detectors are run over all requested leads while the data is in memory.
+Loading and filtering therefore scale with the number of recordings and
+not with recordings x detectors.
+The results are stored per detector in the same layout as before:
+results/<prefix>_<detector>.json with lead -> experiment -> list of results.
+The cost of every detector run (wall time, CPU time, samples/sec and
+peak memory increment) is stored in the same way as results/cost_<detector>.json.
+
+The recordings come from a dataset provider (see datasets.py), by
+default the online GUDB. Results of other datasets are stored in
+results/<dataset name>.
+
+Running this script evaluates all detectors for JMX and sensitivity in
+one pass:
+python benchmark.py [--dataset synthetic]
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+from ecgdetectors import Detectors
+
+import datasets # where the recordings come from
+import detection_cache # detections are only computed once per signal
+import aggregate
+import prefetch # the next recordings are loaded while the detectors run
+import tracing # optional timing of the stages
+import beat_file
+from checkpoint import Checkpoint
+import results_store
+import jmx_analysis
+import sensitivity_analysis
+
+# directory where the results are stored
+resultsdir = "results"
+
+try:
+    os.mkdir(resultsdir)
+except OSError as error:
+    pass
+
+# result prefix of the detector cost which is stored with every run
+cost_prefix = "cost"
+
+# prefix of the per beat results which go into results/beats.bin instead of the json files
+beats_prefix = "beats"
+
+# the recordings, their sampling rate, subjects, experiments and leads
+dataset = datasets.GUDB()
+fs = dataset.fs #sampling rate
+
+
+def use_dataset(d):
+    """Selects the dataset provider and its results directory."""
+    global dataset, fs, resultsdir
+    dataset = d
+    fs = d.fs
+    resultsdir = "results" if d.name == "gudb" else "results/" + d.name
+    os.makedirs(resultsdir, exist_ok=True)
+    results_store.resultsdir = resultsdir
+
+
+def score_jmx(detected_peaks, data_anno, data, fs):
+    return jmx_analysis.evaluate(detected_peaks, data_anno, fs, len(data)) # perform interval based analysis
+
+
+def score_sensitivity(detected_peaks, data_anno, data, fs):
+    return sensitivity_analysis.evaluate(detected_peaks, data_anno, fs/10) # perform interval based analysis
+
+
+def score_sensitivity_curve(detected_peaks, data_anno, data, fs):
+    sensitivity, ppv, tp, fp, fn = sensitivity_analysis.curve(detected_peaks, data_anno, fs) # all tolerances at once
+    return {"sensitivity" : [None if np.isnan(v) else float(v) for v in sensitivity],
+            "ppv" : [None if np.isnan(v) else float(v) for v in ppv]}
+
+
+def score_beats(detected_peaks, data_anno, data, fs):
+    return jmx_analysis.beat_details(detected_peaks, data_anno) # matched pairs, offsets, missed and extra beats
+
+
+def detect_and_score(detector, data, data_anno, scores, fs):
+    """
+    Runs a detector over one lead and applies all scoring functions.
+    Returns a dict of result prefix -> result which also contains the
+    cost of the detector.
+    """
+    ### Applying detector to each subject ECG data set then correct for mean detector
+    # delay as referenced to annotated R peak position
+    # Note: the correction factor for each detector doesn't need to be exact,
+    # but centres the detection point for finding the nearest annotated match
+    # It may/will be different for different subjects and experiments
+    with tracing.stage("detect", detector = detector[1].__name__):
+        detected_peaks, cost = detection_cache.detect_with_cost(detector, data, fs) # call detector class for current detector (or use the cached detections)
+
+    results = {}
+    for prefix, score in scores.items():
+        with tracing.stage("score_" + prefix):
+            results[prefix] = score(detected_peaks, data_anno, data, fs)
+    results[cost_prefix] = cost # wall/CPU time, samples/sec and peak memory of the detector
+    return results
+
+
+def evaluate_task(detector, record_lead, experiment, subject_number, scores):
+    """
+    Evaluates a single detector on a single lead of a recording.
+    Returns a dict of result prefix -> result or None if there are no annotations.
+    """
+    print("Analysing subject {}, {}, {}, {}".format(subject_number, experiment, record_lead, detector[0]))
+
+    with tracing.stage("load"):
+        recording = dataset.load(subject_number, experiment, record_lead)
+    if recording is None: # only proceed if an annotation exists
+        return None
+
+    data, data_anno, fs, metadata = recording
+    return detect_and_score(detector, data, data_anno, scores, fs)
+
+
+def load_recording(subject_number, experiment, leads = None):
+    """Loads all leads of a recording: dict lead -> dataset.load() result (None if no annotations)."""
+    if leads is None:
+        leads = dataset.leads
+    # the dataset keeps the recording loaded for all its leads
+    with tracing.stage("load", subject = subject_number, experiment = experiment):
+        return {record_lead : dataset.load(subject_number, experiment, record_lead) for record_lead in leads}
+
+
+def evaluate_recording(subject_number, experiment, detector_list, scores, leads = None, loaded = None):
+    """
+    Loads one recording and runs all detectors over all leads.
+    scores: dict of result prefix -> scoring function(detected_peaks, data_anno, data, fs)
+    loaded: the result of load_recording() if the recording has already been loaded
+    Returns a dict (detectorname, lead) -> {prefix : result} for all leads with annotations.
+    """
+    if leads is None:
+        leads = dataset.leads
+    if loaded is None:
+        loaded = load_recording(subject_number, experiment, leads)
+
+    results = {}
+
+    for record_lead in leads:
+
+        recording = loaded[record_lead]
+        if recording is None: # only proceed if an annotation exists
+            continue
+
+        data, data_anno, fs, metadata = recording # set data array (i.e. recording to be processed)
+
+        for detector in detector_list:
+
+            print("Analysing subject {}, {}, {}, {}".format(subject_number, experiment, record_lead, detector[0]))
+
+            results[(detector[1].__name__, record_lead)] = detect_and_score(detector, data, data_anno, scores, fs)
+
+    return results
+
+
+def selection(leads, experiments, subjects):
+    """Leads, experiments and subjects of a run, all of the dataset if None."""
+    return (dataset.leads if leads is None else leads,
+            dataset.experiments if experiments is None else experiments,
+            dataset.subjects if subjects is None else subjects)
+
+
+# values of the running statistics which are printed at the end of a run
+summary_names = ("jitter", "accuracy", "jmx", "sensitivity")
+
+
+def summary_values(r):
+    """The scalar values of the results of a task for the running statistics."""
+    values = {}
+    if "jmx" in r:
+        values.update({k : r["jmx"][k] for k in (jmx_analysis.key_jitter, jmx_analysis.key_accuracy, jmx_analysis.key_jmx)})
+    if "sens" in r:
+        values["sensitivity"] = r["sens"][0]
+    return values
+
+
+def beat_writer(scores):
+    """Writer of results/beats.bin if the per beat results are requested (else None)."""
+    if beats_prefix not in scores:
+        return None
+    return beat_file.BeatWriter(resultsdir+"/beats.bin")
+
+
+def store_beats(writer, task, r):
+    """Moves the per beat results of a task from its results r to the beat file."""
+    if r is not None and beats_prefix in r:
+        writer.write(task, r.pop(beats_prefix))
+
+
+def checkpoint_file(scores, detectornames):
+    """
+    Checkpoint of a run with these result prefixes and detectors (by name
+    for a single detector, else by a hash of the sorted names) so that runs
+    over different detectors or parameter grids don't share it.
+    """
+    name = "_".join(scores)
+    if len(detectornames) == 1:
+        name = name+"_"+detectornames[0]
+    else:
+        name = name+"_"+hashlib.sha1("\n".join(sorted(detectornames)).encode()).hexdigest()[:12]
+    return resultsdir+"/checkpoint_"+name+".jsonl"
+
+
+def gather(done, detectornames, prefixes, leads, experiments, subjects):
+    """
+    Assembles the finished tasks done[(detectorname, lead, experiment, subject)]
+    into (prefix, detectorname) -> lead -> experiment -> list of results
+    in subject order. Failed (or not evaluated) tasks are None so that
+    every subject keeps its position; recordings without annotations
+    are left out as before.
+    """
+    results = {}
+    for prefix in prefixes:
+        for detectorname in detectornames:
+            results[(prefix, detectorname)] = {
+                record_lead : {experiment : [] for experiment in experiments} for record_lead in leads}
+
+    for detectorname in detectornames:
+        for record_lead in leads:
+            for experiment in experiments:
+                for subject_number in subjects:
+                    task = (detectorname, record_lead, experiment, subject_number)
+                    if task in done and done[task] is None: # no annotations
+                        continue
+                    r = done.get(task, {}) # failed or not evaluated: placeholder
+                    for prefix in prefixes:
+                        # no cost in old checkpoints
+                        results[(prefix, detectorname)][record_lead][experiment].append(r.get(prefix))
+    return results
+
+
+def save_results(prefix, detectorname, data):
+    with tracing.stage("serialize_json"):
+        serialized_data = json.dumps(data,indent="\t")
+    with open(resultsdir+"/"+prefix+"_"+detectorname+".json","w") as f:
+        f.write(serialized_data)
+
+
+def save_all(results):
+    for (prefix, detectorname), data in results.items():
+        save_results(prefix, detectorname, data)
+
+
+def save(done, detectornames, scores, leads, experiments, subjects):
+    """
+    Saves the finished tasks as json files per detector and
+    in the columnar results store together with the detector cost.
+    """
+    prefixes = [prefix for prefix in scores if prefix != beats_prefix] + [cost_prefix]
+    save_all(gather(done, detectornames, prefixes, leads, experiments, subjects))
+    for prefix in prefixes:
+        rows = []
+        for (detectorname, record_lead, experiment, subject_number), r in done.items():
+            if r is not None and detectorname in detectornames and prefix in r:
+                # named records (WFDB) are stored by their position
+                rows.append((detectorname, record_lead, experiment,
+                             results_store.subject_key(subjects, subject_number), r[prefix]))
+        results_store.update(prefix, rows)
+
+
+def evaluate_all(detector_list, scores, leads = None, experiments = None, subjects = None,
+                 depth = prefetch.depth):
+    """
+    Evaluates all detectors recording by recording and saves the
+    results/<prefix>_<detector>.json files. Every finished recording
+    is committed to the checkpoint and skipped if the run is restarted.
+    leads, experiments and subjects default to all of the dataset.
+    depth: number of recordings which are loaded ahead in the background
+    """
+    leads, experiments, subjects = selection(leads, experiments, subjects)
+    detectornames = [detector[1].__name__ for detector in detector_list]
+    ckpt = Checkpoint(checkpoint_file(scores, detectornames))
+    if len(ckpt) > 0:
+        print("Resuming: {} tasks already done".format(len(ckpt)))
+
+    # running statistics per detector/lead/experiment, updated with every result
+    averages = aggregate.Aggregator(summary_names)
+    for (detectorname, record_lead, experiment, subject_number), r in ckpt.done.items():
+        if r is not None:
+            averages.update((detectorname, record_lead, experiment), summary_values(r))
+
+    # recordings with unfinished tasks and their detectors
+    recordings = []
+    for experiment in experiments: # loop for all chosen experiments
+        for subject_number in subjects: # loop for all subjects
+            todo = [detector for detector in detector_list
+                    if any((detector[1].__name__, record_lead, experiment, subject_number) not in ckpt
+                           for record_lead in leads)]
+            if todo:
+                recordings.append((experiment, subject_number, tuple(todo)))
+
+    def load(recording):
+        experiment, subject_number, todo = recording
+        return load_recording(subject_number, experiment, leads)
+
+    beats = beat_writer(scores)
+    try:
+        for (experiment, subject_number, todo), loaded in prefetch.prefetch(load, recordings, depth):
+            with tracing.task("{}_{}".format(experiment, subject_number)):
+                r = evaluate_recording(subject_number, experiment, todo, scores, leads, loaded)
+            for detector in todo:
+                for record_lead in leads:
+                    task = (detector[1].__name__, record_lead, experiment, subject_number)
+                    if task in ckpt:
+                        continue
+                    if (detector[1].__name__, record_lead) in r:
+                        store_beats(beats, task, r[(detector[1].__name__, record_lead)])
+                        ckpt.append(task, r[(detector[1].__name__, record_lead)])
+                        averages.update(task[:3], summary_values(r[(detector[1].__name__, record_lead)]))
+                    else:
+                        ckpt.append(task, None)
+    finally:
+        if beats is not None:
+            beats.close()
+
+    save(ckpt.done, detectornames, scores, leads, experiments, subjects)
+    ckpt.remove()
+
+    for name in summary_names:
+        averages.print_summary(name)
+
+
+def finalize(detectornames, scores, leads = None, experiments = None, subjects = None):
+    """Writes the result files from the checkpoint of an unfinished run."""
+    leads, experiments, subjects = selection(leads, experiments, subjects)
+    ckpt = Checkpoint(checkpoint_file(scores, detectornames))
+    print("Finalizing {} tasks from {}".format(len(ckpt), ckpt.filename))
+    save(ckpt.done, detectornames, scores, leads, experiments, subjects)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default="gudb",
+                        help="gudb, gudb:<path>, wfdb:<path>[:<annotator>] or synthetic[:<subjects>]")
+    args = parser.parse_args()
+    use_dataset(datasets.from_name(args.dataset))
+
+    detectors = Detectors(fs) # Initialise detectors for the sampling rate of the dataset
+    evaluate_all(detectors.detector_list, {"jmx" : score_jmx, "sens" : score_sensitivity,
+                                                 "sens_curve" : score_sensitivity_curve})
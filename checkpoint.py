@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Append-only checkpoint of finished benchmark tasks
+==================================================
+Every finished (detector, lead, experiment, subject) task is written as
+one JSON line and synced to disk straight away. When a run is killed
+the next run skips all tasks which are in the checkpoint so that at
+most the tasks which were running are lost.
+The per-detector JSON files are then assembled from the checkpoint.
+"""
+
+import os
+import json
+
+import tracing
+
+
+class Checkpoint:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = {}
+        try:
+            with open(filename,"r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line cut off by a crash
+                        continue
+                    task = (entry["detector"], entry["lead"], entry["experiment"], entry["subject"])
+                    self.done[task] = entry["results"]
+        except OSError:
+            pass
+        self.f = None
+
+    def __contains__(self, task):
+        return task in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def repair(self):
+        """Cuts off a last line which was only partly written (crash) so that the next entry starts on a new line."""
+        try:
+            with open(self.filename,"rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+        except OSError:
+            pass
+
+    def append(self, task, results):
+        """
+        Commits the results of the task (detectorname, lead, experiment, subject)
+        to disk. results is None if there were no annotations.
+        """
+        if self.f is None:
+            self.repair()
+            self.f = open(self.filename,"a")
+        detectorname, record_lead, experiment, subject_number = task
+        entry = {"detector" : detectorname,
+                 "lead" : record_lead,
+                 "experiment" : experiment,
+                 "subject" : subject_number,
+                 "results" : results}
+        with tracing.stage("checkpoint"):
+            self.f.write(json.dumps(entry)+"\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+        self.done[task] = results
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def remove(self):
+        """Removes the checkpoint once the final results have been written."""
+        self.close()
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Dataset providers
+=================
+The benchmark gets its recordings from a dataset provider. Every provider
+has a name, a sampling rate fs, the lists of subjects, experiments and
+default leads and a method
+
+    load(subject, experiment, lead) -> (signal, annotations, fs, metadata)
+
+which returns None if there are no annotations for this lead.
+
+GUDB:      the Glasgow University database, online or from a local copy
+           of its experiment_data directory (memory mapped via gudb_cache)
+WFDB:      a directory of WFDB records such as the MIT-BIH databases
+           (needs the wfdb package)
+Synthetic: synthetic ECGs with known R peaks for any number of subjects
+
+Providers can be selected by name with from_name():
+gudb, gudb:<path>, wfdb:<path>[:<annotator>], synthetic[:<subjects>]
+"""
+
+import os
+import threading
+import collections
+import numpy as np
+from ecg_gudb_database import GUDb
+
+import gudb_cache
+import leads as lead_registry
+import synthetic
+import tracing
+
+
+class GUDB:
+
+    fs = 250 # sampling rate
+    experiments = ["sitting","maths","walking","hand_bike","jogging"]
+    subjects = list(range(0, 25))
+    leads = ["einthoven_ii", "chest_strap_V2_V1"] # can be expanded if required (see leads.py)
+
+    keep = 4 # loaded recordings which are kept (the current one and the prefetched ones)
+
+    def __init__(self, path = None, cache = True):
+        """
+        path: local experiment_data directory (default: online)
+        cache: keep the recordings in the local memory mapped cache
+        """
+        self.path = path
+        self.cache = cache
+        self.name = "gudb" # online or local copy: the same recordings
+        self.recordings = collections.OrderedDict() # (subject, experiment) -> lead registry
+        self.lock = threading.Lock() # prefetch threads load recordings at the same time
+
+    def __getstate__(self):
+        # don't send the loaded recordings to worker processes
+        state = self.__dict__.copy()
+        del state["recordings"]
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.recordings = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def open(self, subject_number, experiment):
+        """Returns the lead registry of a recording. The last 'keep' ones are kept."""
+        key = (subject_number, experiment)
+        with self.lock:
+            if key in self.recordings:
+                self.recordings.move_to_end(key)
+                return self.recordings[key]
+        # loaded without the lock so that several recordings can be loaded at once
+        url = gudb_cache.gudb_url if self.path is None else self.path
+        with tracing.stage("gudb_load", subject = subject_number, experiment = experiment):
+            if self.cache:
+                ecg_class = gudb_cache.CachedGUDb(subject_number, experiment, url)
+            else:
+                ecg_class = GUDb(subject_number, experiment, url)
+        recording = lead_registry.Recording(ecg_class)
+        with self.lock:
+            recording = self.recordings.setdefault(key, recording)
+            self.recordings.move_to_end(key)
+            while len(self.recordings) > self.keep:
+                self.recordings.popitem(last = False)
+        return recording
+
+    def load(self, subject_number, experiment, record_lead):
+        recording = self.open(subject_number, experiment)
+        data_anno = recording.annotations(record_lead)
+        if data_anno is None:
+            if recording.annotation_source(record_lead) == "cs":
+                print("No chest strap annotations exist for subject %d, %s exercise" %(subject_number, experiment))
+            else:
+                print("No cables annotations exist for subject %d, %s exercise" %(subject_number, experiment))
+            return None
+        metadata = {"dataset" : self.name, "subject" : subject_number,
+                    "experiment" : experiment, "lead" : record_lead}
+        # only this lead is loaded (and filtered if needed)
+        with tracing.stage("lead", lead = record_lead):
+            data = recording[record_lead]
+        return data, data_anno, self.fs, metadata
+
+
+class WFDB:
+
+    # annotation symbols which are heartbeats
+    beat_symbols = set("NLRBAaJSVrFejnE/fQ?")
+
+    experiments = ["record"]
+
+    def __init__(self, path, annotator = "atr", leads = None):
+        """
+        path: directory with the WFDB records (RECORDS file or .hea files)
+        annotator: extension of the annotation files
+        leads: signal names to be evaluated (default: the first signal)
+        """
+        import wfdb # optional dependency
+        self.wfdb = wfdb
+        self.path = path
+        self.annotator = annotator
+        self.name = "wfdb_" + os.path.basename(os.path.normpath(path))
+        records = os.path.join(path, "RECORDS")
+        if os.path.exists(records):
+            with open(records,"r") as f:
+                self.subjects = [r.strip() for r in f if r.strip()]
+        else:
+            self.subjects = sorted(f[:-4] for f in os.listdir(path) if f.endswith(".hea"))
+        header = wfdb.rdheader(os.path.join(path, self.subjects[0]))
+        self.fs = header.fs
+        self.leads = leads if leads is not None else header.sig_name[:1]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["wfdb"]
+        return state
+
+    def __setstate__(self, state):
+        import wfdb
+        self.__dict__.update(state)
+        self.wfdb = wfdb
+
+    def load(self, subject, experiment, lead):
+        record_name = os.path.join(self.path, subject)
+        try:
+            ann = self.wfdb.rdann(record_name, self.annotator)
+        except FileNotFoundError:
+            print("No annotations exist for record %s" % subject)
+            return None
+        record = self.wfdb.rdrecord(record_name, channel_names = [lead])
+        if record.p_signal is None or record.p_signal.shape[1] == 0:
+            print("No lead %s in record %s" % (lead, subject))
+            return None
+        beats = np.array([s in self.beat_symbols for s in ann.symbol], dtype=bool)
+        metadata = {"dataset" : self.name, "subject" : subject,
+                    "experiment" : experiment, "lead" : lead}
+        return record.p_signal[:, 0], ann.sample[beats], self.fs, metadata
+
+
+class Synthetic:
+
+    name = "synthetic"
+    leads = ["einthoven_ii", "chest_strap_V2_V1"]
+
+    # experiment -> (heart rate, relative noise)
+    conditions = {
+        "sitting" : (70, 0.02),
+        "maths" : (80, 0.02),
+        "walking" : (100, 0.05),
+        "hand_bike" : (120, 0.1),
+        "jogging" : (150, 0.2),
+    }
+    experiments = list(conditions)
+
+    def __init__(self, n_subjects = 1000, duration = 120, fs = 250, seed = 0):
+        """
+        n_subjects: number of subjects
+        duration: length of every recording in s
+        """
+        self.subjects = list(range(n_subjects))
+        self.duration = duration
+        self.fs = fs
+        self.seed = seed
+
+    def load(self, subject_number, experiment, lead):
+        if lead not in self.leads:
+            raise ValueError("Unknown lead: {} (synthetic leads: {})".format(lead, ", ".join(self.leads)))
+        hr, noise = self.conditions[experiment]
+        e = self.experiments.index(experiment)
+        # the same beats for all leads of a recording, different noise
+        seed = [self.seed, subject_number, e]
+        n_beats = int(self.duration * hr / 60)
+        det, anno, nSamples = synthetic.beats(n_beats, self.fs, 0, 0, 0, 0, hr, seed = seed)
+        data = synthetic.ecg(anno, nSamples, self.fs, noise, seed = seed + [self.leads.index(lead)])
+        metadata = {"dataset" : self.name, "subject" : subject_number,
+                    "experiment" : experiment, "lead" : lead}
+        return data, anno, self.fs, metadata
+
+
+def from_name(name):
+    """
+    Creates a provider from its name:
+    gudb, gudb:<path>, wfdb:<path>[:<annotator>], synthetic[:<subjects>]
+    """
+    kind, _, arg = name.partition(":")
+    if kind == "gudb":
+        return GUDB(arg if arg else None)
+    if kind == "wfdb":
+        path, _, annotator = arg.partition(":")
+        return WFDB(path, annotator if annotator else "atr")
+    if kind == "synthetic":
+        return Synthetic(int(arg)) if arg else Synthetic()
+    raise ValueError("Unknown dataset: " + name)
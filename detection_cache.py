@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Content addressed cache of detector outputs
+===========================================
+The detections are stored as int32 sample indices in .npy files. The
+key is a hash of the detector (module and qualified name of its
+function, the ecgdetectors version or the source code of detectors from
+other modules, and the non-default parameters of registry variants),
+the sampling rate and the input signal itself so that the JMX and the
+sensitivity pipelines (and any re-scoring with different parameters)
+only run a detector once per signal.
+The cache directory defaults to ~/.cache/jmx_detections and can be
+changed with the environment variable DETECTION_CACHE.
+Setting DETECTION_CACHE=off disables the cache.
+
+The computational cost of the detector (wall time, CPU time, samples
+per second and peak memory increment) is measured when it runs and
+stored next to the detections (<key>.json) so that cached detections
+still report the cost of the original run.
+The peak memory needs a second run of the detector under tracemalloc
+which is many times slower than the detector itself. It's only
+measured with DETECTION_MEMORY=1 (otherwise it's None) and added to
+cached entries which don't have it yet.
+"""
+
+import os
+import json
+import time
+import hashlib
+import inspect
+import tracemalloc
+import numpy as np
+
+import tracing
+from importlib import metadata
+
+cachedir = os.environ.get("DETECTION_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "jmx_detections"))
+
+enabled = cachedir != "off"
+
+# measure the peak memory of the detectors (second run under tracemalloc)
+measure_memory = os.environ.get("DETECTION_MEMORY", "0") not in ("", "0", "off")
+
+# a new version of the detectors invalidates all cached detections
+detector_version = metadata.version("py-ecg-detectors")
+
+
+def detector_id(func):
+    """
+    Identity of a detector function: module.qualname, the version of
+    ecgdetectors or a hash of the source of other detectors and the
+    parameters of a detector_registry.Variant which aren't the defaults.
+    """
+    params = getattr(func, "params", {})
+    func = getattr(func, "func", func) # the function of a Variant
+    f = getattr(func, "__func__", func) # bound methods (Detectors)
+    name = "{}.{}".format(getattr(f, "__module__", ""), getattr(f, "__qualname__", getattr(f, "__name__", repr(f))))
+    if getattr(f, "__module__", None) == "ecgdetectors":
+        version = detector_version
+    else:
+        try:
+            version = hashlib.sha256(inspect.getsource(f).encode()).hexdigest()
+        except (OSError, TypeError):
+            version = str(getattr(inspect.getmodule(f), "__version__", ""))
+    try:
+        defaults = {k : p.default for k, p in inspect.signature(func).parameters.items()}
+    except (TypeError, ValueError):
+        defaults = {}
+    changed = sorted((k, repr(v)) for k, v in params.items() if k not in defaults or defaults[k] != v)
+    return "{}\0{}\0{}".format(name, version, changed)
+
+
+def key(func, fs, data):
+    data = np.ascontiguousarray(data)
+    h = hashlib.sha256()
+    h.update("{}\0{}\0{}\0{}\0".format(detector_id(func), fs, data.dtype.str, data.shape).encode())
+    h.update(memoryview(data).cast("B"))
+    return h.hexdigest()
+
+
+def peak_memory(detector, data):
+    """Peak memory increment of the detector in bytes (slow: runs it under tracemalloc)."""
+    with tracing.stage("detector_memory", detector = detector[1].__name__):
+        tracemalloc.start()
+        detector[1](data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak
+
+
+def run(detector, data):
+    """
+    Runs the detector and returns the detections and its cost.
+    The memory is measured in a second run (if measure_memory) as
+    tracemalloc slows down the detector.
+    """
+    with tracing.stage("detector", detector = detector[1].__name__):
+        t0 = time.perf_counter()
+        c0 = time.process_time()
+        detected_peaks = np.asarray(detector[1](data), dtype=np.int32)
+        wall_time = time.perf_counter() - t0
+        cpu_time = time.process_time() - c0
+
+    cost = {"wall_time" : wall_time,
+            "cpu_time" : cpu_time,
+            "samples_per_sec" : len(data) / wall_time if wall_time > 0 else float("inf"),
+            "peak_memory" : peak_memory(detector, data) if measure_memory else None}
+    return detected_peaks, cost
+
+
+def detect_with_cost(detector, data, fs):
+    """
+    Returns the detections of detector (name, function) for data and
+    the cost dict of the detector from the cache or runs the detector
+    and stores both.
+    """
+    if not enabled:
+        return run(detector, data)
+
+    k = key(detector[1], fs, data)
+    filename = os.path.join(cachedir, k[:2], k)
+
+    if os.path.exists(filename + ".npy") and os.path.exists(filename + ".json"):
+        with tracing.stage("detection_cache_read"), open(filename + ".json","r") as f:
+            detected_peaks, cost = np.load(filename + ".npy"), json.loads(f.read())
+        if not measure_memory or cost.get("peak_memory") is not None:
+            return detected_peaks, cost
+        # cached without the memory: only the memory is measured
+        cost["peak_memory"] = peak_memory(detector, data)
+        write_json(filename, cost)
+        return detected_peaks, cost
+
+    detected_peaks, cost = run(detector, data)
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp = filename + ".%d" % os.getpid()
+    np.save(tmp + ".npy", detected_peaks)
+    os.replace(tmp + ".npy", filename + ".npy") # atomic if several processes write the same entry
+    write_json(filename, cost)
+    return detected_peaks, cost
+
+
+def write_json(filename, cost):
+    tmp = filename + ".%d" % os.getpid()
+    with open(tmp + ".json","w") as f:
+        f.write(json.dumps(cost))
+    os.replace(tmp + ".json", filename + ".json")
+
+
+def detect(detector, data, fs):
+    """
+    Returns the detections of detector (name, function) for data
+    from the cache or runs the detector and stores them.
+    """
+    return detect_with_cost(detector, data, fs)[0]
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Detector registry
+=================
+Any callable detector(unfiltered_ecg, **params) -> R peak positions can
+be registered together with a grid of its keyword parameters. Every
+combination of the grid becomes a variant which is evaluated like any
+other detector: its name contains the parameters which differ from the
+defaults of the function so that the result files, the checkpoint and
+the detection cache are kept apart for every parameter set, for example
+
+    pan_tompkins_detector__MWA_name-convolve
+
+The variant with the default parameters keeps the plain name of the
+detector and shares its results with the normal runs.
+
+    detector_registry.register_detectors(Detectors(fs))
+    detector_registry.register(my_detector, {"threshold" : [0.3, 0.5]})
+    detector_list = detector_registry.detector_list(["my_detector"])
+
+Detectors can be given as their index in Detectors.detector_list, their
+registered name or module:function which is imported and registered.
+The functions have to be importable (module level or methods) so that
+they can be sent to the worker processes.
+The parameters of the variants of a run are stored in
+results/variants.json.
+"""
+
+import os
+import json
+import inspect
+import importlib
+import itertools
+
+# name -> (label, function, grid)
+registry = {}
+
+
+class Variant:
+    """A detector function with fixed keyword parameters."""
+
+    def __init__(self, func, params, name):
+        self.func = func
+        self.params = dict(params)
+        self.__name__ = name
+
+    def __call__(self, unfiltered_ecg):
+        return self.func(unfiltered_ecg, **self.params)
+
+
+def defaults(func):
+    """Default values of the keyword parameters of func."""
+    return {k : p.default for k, p in inspect.signature(func).parameters.items()
+            if p.default is not inspect.Parameter.empty}
+
+
+def variant_name(name, func, params):
+    """name with all parameters which aren't the defaults of func."""
+    d = defaults(func)
+    changed = sorted((k, v) for k, v in params.items() if k not in d or d[k] != v)
+    return name + "".join("__{}-{}".format(k, v) for k, v in changed)
+
+
+def register(func, grid = None, name = None, label = None):
+    """
+    Registers a detector function with an optional parameter grid
+    (dict parameter -> list of values). Returns its name.
+    """
+    if name is None:
+        name = func.__name__
+    if label is None:
+        label = name
+    registry[name] = (label, func, dict(grid) if grid else {})
+    return name
+
+
+def register_detectors(detectors):
+    """Registers the detectors of an ecgdetectors.Detectors instance."""
+    for label, func in detectors.detector_list:
+        register(func, label = label)
+
+
+def resolve(spec):
+    """
+    Name of the registered detector for an index in the detector list,
+    a registered name or module:function (which is then registered).
+    """
+    if spec in registry:
+        return spec
+    if spec.isdigit():
+        return list(registry)[int(spec)]
+    module, _, function = spec.partition(":")
+    if not function:
+        raise ValueError("Unknown detector: " + spec)
+    return register(getattr(importlib.import_module(module), function))
+
+
+def expand(name, grid = None):
+    """The (label, Variant) detectors of all combinations of the grid (default: the registered one)."""
+    label, func, registered = registry[name]
+    if grid is None:
+        grid = registered
+    accepted = inspect.signature(func).parameters
+    for k in grid:
+        if k not in accepted:
+            raise ValueError("{} has no parameter {}".format(name, k))
+    keys = sorted(grid)
+    detectors = []
+    for values in itertools.product(*[grid[k] for k in keys]):
+        params = dict(zip(keys, values))
+        shown = ", ".join("{}={}".format(k, v) for k, v in params.items())
+        detectors.append((label + (" (" + shown + ")" if shown else ""),
+                          Variant(func, params, variant_name(name, func, params))))
+    return detectors
+
+
+def detector_list(specs = None, grid = None):
+    """
+    All variants of the detectors in specs (default: all registered ones).
+    grid: parameter grid for all of them instead of the registered ones.
+    """
+    names = [resolve(str(spec)) for spec in specs] if specs else list(registry)
+    return [detector for name in names for detector in expand(name, grid)]
+
+
+def parse_value(s):
+    try:
+        return json.loads(s)
+    except ValueError:
+        return s # a string without quotes
+
+
+def parse_grid(items):
+    """Grid from command line items parameter=value1,value2,... (None if there are none)."""
+    if not items:
+        return None
+    grid = {}
+    for item in items:
+        k, _, values = item.partition("=")
+        grid[k] = [parse_value(v) for v in values.split(",")]
+    return grid
+
+
+def save_index(detector_list, resultsdir):
+    """Adds the variants of a run to resultsdir/variants.json (name -> detector and parameters)."""
+    filename = os.path.join(resultsdir, "variants.json")
+    index = {}
+    if os.path.exists(filename):
+        with open(filename,"r") as f:
+            index = json.load(f)
+    for label, variant in detector_list:
+        if isinstance(variant, Variant):
+            index[variant.__name__] = {"detector" : variant.func.__name__, "label" : label,
+                                       "params" : variant.params}
+    with open(filename,"w") as f:
+        f.write(json.dumps(index, indent="\t", default=str))
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Local recording cache for the GUDB
+==================================
+The first time a recording is requested it is loaded with
+ecg_gudb_database and every file (ECG leads and the annotations)
+is stored as a .npy file. From then on the recording is read back
+memory mapped without any network access or text parsing.
+The cache is keyed by the dataset version, subject and experiment:
+<cachedir>/<dataset_version>/subject_XX/<experiment>/ECG.npy
+Recordings from a local GUDB directory (url is a path) are cached
+separately for every directory.
+The cache directory defaults to ~/.cache/gudb and can be changed with
+the environment variable GUDB_CACHE.
+
+To warm the cache so that the benchmark can run offline:
+python gudb_cache.py
+"""
+
+import os
+import io
+import hashlib
+import numpy as np
+import requests
+from importlib import metadata
+from ecg_gudb_database import GUDb
+
+# where the recordings are loaded from if they are not in the cache
+gudb_url = "https://berndporr.github.io/ECG-GUDB/experiment_data"
+
+# different versions of the database are cached separately
+dataset_version = "gudb-" + metadata.version("ecg_gudb_database")
+
+cachedir = os.environ.get("GUDB_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "gudb"))
+
+
+def cache_key(url):
+    """Directory in the cache for the recordings from url."""
+    if url == gudb_url:
+        return dataset_version
+    path = os.path.abspath(url)
+    return dataset_version + "-" + hashlib.sha1(path.encode()).hexdigest()[:12]
+
+
+class CachedGUDb(GUDb):
+    """
+    Drop-in replacement for GUDb which reads the recordings from the
+    local cache and only loads them from the url if they are missing.
+    """
+
+    def __init__(self, _subj, _experiment, url = gudb_url):
+        self.url = url
+        self.cachedir = os.path.join(cachedir, cache_key(url))
+        super().__init__(_subj, _experiment, url)
+
+    def loadDataFromURL(self, url):
+        # .../subject_XX/experiment/ECG.tsv -> <cache>/subject_XX/experiment/ECG
+        filename = os.path.join(self.cachedir, os.path.splitext(url[len(self.url)+1:])[0])
+
+        if os.path.exists(filename + ".npy"):
+            return np.load(filename + ".npy", mmap_mode="r")
+        if os.path.exists(filename + ".missing"):
+            # annotations which don't exist in the database
+            raise FileNotFoundError(url)
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        if ("http:" in url) or ("https:" in url):
+            r = requests.get(url)
+            if r.status_code == 404:
+                open(filename + ".missing", "w").close()
+            r.raise_for_status()
+            c = np.loadtxt(io.StringIO(r.content.decode('utf-8')))
+        else:
+            if not os.path.exists(url):
+                open(filename + ".missing", "w").close()
+            c = np.loadtxt(url)
+
+        # column major so that every lead is a contiguous view of the file
+        tmp = filename + ".%d.npy" % os.getpid()
+        np.save(tmp, np.asfortranarray(c))
+        os.replace(tmp, filename + ".npy") # atomic if several processes fill the cache
+        return np.load(filename + ".npy", mmap_mode="r")
+
+
+def warm():
+    """Loads all subjects and experiments into the cache."""
+    for experiment in GUDb.experiments:
+        for subject_number in range(0, GUDb.total_subjects):
+            print("Caching subject {}, {}".format(subject_number, experiment))
+            CachedGUDb(subject_number, experiment)
+    print("Cache:", os.path.join(cachedir, cache_key(gudb_url)))
+
+
+if __name__ == "__main__":
+    warm()
@@ -11,6 +11,7 @@ The overall score is then: JMX = Jitter/% * Accuracy/%.
 """
 import numpy as np
 import util
+import tracing
 from scipy import stats
 
 # Used to determine how many beats could have been at max heartrate.
@@ -20,6 +21,9 @@ maxHR = 220
 # The standard jitter time at the moment for standard detectors.
 norm_jitter = 12E-3 # sec
 
+# scale of the median absolute deviation (as scipy's median_absolute_deviation)
+mad_scale = 1.4826
+
 a = 10 # number of annotated beats to trim from start
 b = -5 # number of annotated beats to trim from end
 
@@ -38,35 +42,73 @@ def mapping_jitter(x):
     return 1/(x+1)
 
 
+def match_beats(annotation, detection):
+    """
+    Matches annotations and detections with a sorted merge instead of
+    comparing every annotation with every detection.
+    Every annotation is paired with its nearest detection and every
+    detection then keeps only its closest annotation (the earlier one
+    if there is a tie) which are the rules of the original nearest_diff.
+    annotation: annotated R peaks in samples
+    detection: detected R peaks in samples
+    returns:
+    anno_index  : indices of the matched annotations
+    det_index   : indices of the matched detections
+    diffs       : absolute difference of the pairs in samples
+    missed      : indices of the annotations without a detection
+    extra       : indices of the detections without an annotation
+    """
+    annotation = np.asarray(annotation)
+    detection = np.asarray(detection)
+    n_anno = len(annotation)
+    n_det = len(detection)
+
+    if n_anno == 0 or n_det == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0, dtype=np.result_type(annotation, detection)), np.arange(n_anno), np.arange(n_det)
+
+    # the detections sorted by time; a stable sort keeps duplicates in index order
+    order = np.argsort(detection, kind='stable')
+    det_sorted = detection[order]
+
+    # neighbours to the left and right of every annotation
+    right = np.searchsorted(det_sorted, annotation, side='left')
+    left = np.maximum(right - 1, 0)
+    right = np.minimum(right, n_det - 1)
+    # first occurrence of the left neighbour in case of duplicate detections
+    left = np.searchsorted(det_sorted, det_sorted[left], side='left')
+
+    diff_left = np.abs(det_sorted[left] - annotation)
+    diff_right = np.abs(det_sorted[right] - annotation)
+
+    # nearest detection (lowest detection index on a tie as argmin does)
+    take_left = (diff_left < diff_right) | ((diff_left == diff_right) & (order[left] <= order[right]))
+    nearest = order[np.where(take_left, left, right)]
+    diffs = np.where(take_left, diff_left, diff_right)
+
+    # keep the closest annotation for every detection
+    anno_all = np.arange(n_anno)
+    s = np.lexsort((anno_all, diffs, nearest))
+    group_start = np.flatnonzero(np.r_[True, nearest[s][1:] != nearest[s][:-1]])
+    winners = s[group_start]
+
+    # pairs in the order in which their detection was first used
+    first_used = np.minimum.reduceat(s, group_start)
+    anno_index = winners[np.argsort(first_used, kind='stable')]
+    det_index = nearest[anno_index]
+
+    missed = np.ones(n_anno, dtype=bool)
+    missed[anno_index] = False
+    extra = np.ones(n_det, dtype=bool)
+    extra[det_index] = False
+
+    return anno_index, det_index, diffs[anno_index], np.flatnonzero(missed), np.flatnonzero(extra)
+
+
 def nearest_diff(annotation, nearest_match):
-    # Calculates the nearest difference between values in two arrays and saves
-    # index and sample position of nearest
-    
-    len_annotation=len(annotation)
-
-    # Array which will contain matches for all annotations no matter if the actual detection is missing
-    used_indices=[] 
-    for i in range(len_annotation): # scan through 'source' peaks 
-        diff = nearest_match - annotation[i] # subtract ith source array value from ALL nearest match values
-        index = np.abs(diff).argmin() # return the index of the smallest difference value
-        used_indices.append((index,np.abs(nearest_match[index]-annotation[i]))) # save as tuple in used_indices
-
-    # Array which will contain unique instances by always choosing the one which has the shortest time
-    # difference.
-    # 
-    unique_diffs=[]
-    index_used=[]
-    for j in used_indices:
-        if not (j[0] in index_used):
-            uni = []
-            for k in used_indices:
-                if k[0] == j[0]:
-                    uni.append(k)
-            i = np.argmin(uni,0)[1]
-            unique_diffs.append(uni[i][1])
-            index_used.append(j[0])
-        
-    return unique_diffs
+    # Calculates the nearest difference between values in two arrays and
+    # returns the unique annotation / detection differences
+    return match_beats(annotation, nearest_match)[2]
 
 
 def score(jitter,accuracy):
@@ -96,7 +138,8 @@ def evaluate(det_posn, anno_R, fs, nSamples, trim=True):
     """
 
     # Median delay of the detection against the annotations
-    delay_correction = util.calcMedianDelay(det_posn, anno_R)
+    with tracing.stage("calcMedianDelay"):
+        delay_correction = util.calcMedianDelay(det_posn, anno_R)
 
     # Correction for detector delay
     det_posn = np.array(det_posn)-int(delay_correction) 
@@ -117,18 +160,15 @@ def evaluate(det_posn, anno_R, fs, nSamples, trim=True):
     len_det_posn = len(det_posn)
 
     # return anno / detector pairs
-    anno_det_pairs = nearest_diff(anno_R, det_posn) 
+    with tracing.stage("nearest_diff"):
+        anno_det_pairs = nearest_diff(anno_R, det_posn) 
     
-    differences_for_jitter=[]
-        
-    for d in anno_det_pairs: 
-
-        difference = np.abs(d / fs)
-        differences_for_jitter.append(difference)
+    differences_for_jitter = np.abs(anno_det_pairs / fs)
 
     jmx = {}
 
-    jmx[key_jitter] = stats.median_absolute_deviation(differences_for_jitter)
+    with tracing.stage("median_abs_deviation"):
+        jmx[key_jitter] = stats.median_absolute_deviation(differences_for_jitter)
     fp = len_det_posn - len(differences_for_jitter) # all detections - true positive = false positive
     fn = len_anno_R - len(differences_for_jitter) # all detections
     tp = len(differences_for_jitter)
@@ -147,3 +187,132 @@ def evaluate(det_posn, anno_R, fs, nSamples, trim=True):
         jmx[key_jmx] = False
     print(jmx)
     return jmx
+
+
+def beat_details(det_posn, anno_R, trim=True):
+    """
+    Per beat results of the matching in evaluate() as int32 arrays:
+    anno_index : annotations of the matched pairs
+    det_index  : detections of the matched pairs
+    offset     : detection - annotation of the pairs in samples (delay corrected)
+    missed     : annotations without a detection
+    extra      : detections without an annotation (within the trimmed range)
+    The indices refer to the untrimmed anno_R and det_posn.
+    """
+    delay_correction = util.calcMedianDelay(det_posn, anno_R)
+    det_posn = np.array(det_posn)-int(delay_correction)
+    anno_R = np.asarray(anno_R)
+
+    anno_first = 0
+    det_first = 0
+    if trim==True:
+        det_trimmed, anno_trimmed = util.trim_after_detection(det_posn, anno_R, a, b)
+        anno_first = a
+        if len(det_trimmed) > 0:
+            det_first = int(np.searchsorted(det_posn, det_trimmed[0], side='left'))
+        det_posn, anno_R = det_trimmed, anno_trimmed
+
+    anno_index, det_index, diffs, missed, extra = match_beats(anno_R, det_posn)
+    return {"anno_index" : (anno_index + anno_first).astype(np.int32),
+            "det_index" : (det_index + det_first).astype(np.int32),
+            "offset" : (det_posn[det_index] - anno_R[anno_index]).astype(np.int32),
+            "missed" : (missed + anno_first).astype(np.int32),
+            "extra" : (extra + det_first).astype(np.int32)}
+
+
+# record layout of the results of evaluate_batch
+batch_dtype = np.dtype([(key_jitter, float), (key_tp, np.int64), (key_tn, float),
+                        (key_fp, np.int64), (key_fn, np.int64),
+                        (key_accuracy, float), (key_jmx, float)])
+
+
+def evaluate_batch(det_posn, det_offsets, anno_R, anno_offsets, fs, nSamples, trim=True):
+    """
+    JMX analysis of many recordings at once without a loop over the recordings.
+    The detections and annotations of all recordings are concatenated and
+    recording i is det_posn[det_offsets[i]:det_offsets[i+1]] and
+    anno_R[anno_offsets[i]:anno_offsets[i+1]] (both in ascending order).
+    det_posn, det_offsets: detections of all recordings and their offsets
+    anno_R, anno_offsets: annotations of all recordings and their offsets
+    fs: sampling rate of the ECG files
+    nSamples: number of samples of every ECG file
+    returns a structured array (batch_dtype) with one row per recording with
+    the same values as evaluate. Undefined values are NaN.
+    """
+    det_posn = np.asarray(det_posn, dtype=np.int64)
+    anno_R = np.asarray(anno_R, dtype=np.int64)
+    det_counts = np.diff(det_offsets)
+    anno_counts = np.diff(anno_offsets)
+    n_rec = len(det_counts)
+    det_rec = np.repeat(np.arange(n_rec), det_counts)
+    anno_rec = np.repeat(np.arange(n_rec), anno_counts)
+    nSamples = np.broadcast_to(nSamples, (n_rec,))
+
+    result = np.zeros(n_rec, dtype=batch_dtype)
+    if len(det_posn) == 0 or len(anno_R) == 0:
+        result[key_jitter] = np.nan
+        result[key_tn] = np.nan
+        result[key_accuracy] = np.nan
+        result[key_jmx] = np.nan
+        return result
+
+    # every recording is moved into its own range of sample positions so that
+    # nothing can be closer than a beat of the same recording
+    vmin = min(det_posn.min(), anno_R.min())
+    span = 2 * (max(det_posn.max(), anno_R.max()) - vmin) + 2
+    det_key = (det_posn - vmin) + det_rec * (2 * span)
+    anno_key = (anno_R - vmin) + anno_rec * (2 * span)
+
+    # Median delay of the detection against the annotations
+    right = np.minimum(np.searchsorted(anno_key, det_key), len(anno_key) - 1)
+    left = np.maximum(right - 1, 0)
+    d = np.minimum(np.abs(det_key - anno_key[left]), np.abs(det_key - anno_key[right]))
+    delay = util.segmentMedian(d, det_rec, n_rec)
+    delay = np.where(np.isnan(delay), 0, delay).astype(np.int64)
+
+    # Correction for detector delay
+    det_key = det_key - delay[det_rec]
+
+    # Trims the annotations and the detections outwith half an interval
+    if trim==True:
+        local = np.arange(len(anno_R)) - np.repeat(anno_offsets[:-1], anno_counts)
+        anno_keep = (local >= a) & (local <= np.repeat(anno_counts, anno_counts) + b)
+        ok = (anno_counts > a) & (anno_counts >= -b)
+        i = np.asarray(anno_offsets[:-1])[ok]
+        j = np.asarray(anno_offsets[1:])[ok]
+        start_posn = np.full(n_rec, np.iinfo(np.int64).max)
+        end_posn = np.full(n_rec, np.iinfo(np.int64).min)
+        start_posn[ok] = np.trunc((anno_key[i+a]+anno_key[i+a-1])/2)
+        end_posn[ok] = np.trunc((anno_key[j+b]+anno_key[j+b+1])/2)
+        det_keep = (det_key >= start_posn[det_rec]) & (det_key <= end_posn[det_rec])
+        det_key = det_key[det_keep]
+        det_rec = det_rec[det_keep]
+        anno_key = anno_key[anno_keep]
+        anno_rec = anno_rec[anno_keep]
+
+    # anno / detector pairs of the same recording
+    anno_index, det_index, diffs, missed, extra = match_beats(anno_key, det_key)
+    same = anno_rec[anno_index] == det_rec[det_index]
+    pair_rec = anno_rec[anno_index][same]
+    differences_for_jitter = np.abs(diffs[same] / fs)
+
+    # median absolute deviation (scaled like scipy's median_absolute_deviation)
+    med = util.segmentMedian(differences_for_jitter, pair_rec, n_rec)
+    mad = util.segmentMedian(np.abs(differences_for_jitter - med[pair_rec]), pair_rec, n_rec)
+    result[key_jitter] = mad_scale * mad
+
+    tp = np.bincount(pair_rec, minlength=n_rec)
+    fp = np.bincount(det_rec, minlength=n_rec) - tp # all detections - true positive = false positive
+    fn = np.bincount(anno_rec, minlength=n_rec) - tp # all detections
+    maxBeats = nSamples / fs * maxHR / 60
+    tn = maxBeats - (tp + fn + fp) # remaining samples
+    result[key_tp] = tp
+    result[key_tn] = tn
+    result[key_fp] = fp
+    result[key_fn] = fn
+    total = tp + tn + fp + fn
+    with np.errstate(invalid='ignore', divide='ignore'):
+        accuracy = np.where(total > 0, (tp + tn) / total, np.nan)
+    result[key_accuracy] = accuracy
+    result[key_jmx] = score(result[key_jitter], accuracy)
+    return result
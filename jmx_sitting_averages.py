@@ -14,13 +14,17 @@ import sys
 import os
 import numpy as np
 import json
-from ecg_gudb_database import GUDb
+from gudb_cache import CachedGUDb # GUDb recordings via the local cache
+import leads # only the requested lead is loaded/filtered
+import prefetch # the next subjects are loaded while the detector runs
 from ecgdetectors import Detectors
 import pathlib # For local file use
 from multiprocessing import Process
 
 # The JMX analysis for a detector
 import jmx_analysis
+# Running averages which are updated with every result
+import aggregate
 
 # directory where the results are stored
 resultsdir = "results"
@@ -39,10 +43,17 @@ current_dir = pathlib.Path(__file__).resolve()
 recording_leads = "einthoven_ii"
 experiment = "sitting"
 
-jmx_results = np.empty((0,2))
+# running statistics of all detectors together ("all") and of every detector
+averages = aggregate.Aggregator()
 
 f = open("norm_calc.tsv","w")
 
+def load(subject_number):
+    # For online GUDB access (cached locally)
+    recording = leads.Recording(CachedGUDb(subject_number, experiment))
+    # the annotations of the lead (cables or chest strap) and the ECG data numpy array of the lead (filtered if it's a _filt lead)
+    return recording.annotations(recording_leads), recording[recording_leads]
+
 for detector in detectors.detector_list:
 
     detectorname = detector[1].__name__
@@ -50,33 +61,11 @@ for detector in detectors.detector_list:
     
     print("Processing:",detector[0])
 
-    for subject_number in range(0, 25): # loop for all subjects
+    for subject_number, (data_anno, data) in prefetch.prefetch(load, range(0, 25)): # loop for all subjects
 
         print("Analysing subject {}, {}, {}, {}".format(subject_number, experiment, recording_leads, detector[0]))
 
-        # creating class which loads the experiment
-
-        # For online GUDB access
-        ecg_class = GUDb(subject_number, experiment) 
-
-        # getting the raw ECG data numpy arrays from class
-        chest_strap_V2_V1 = ecg_class.cs_V2_V1
-        einthoven_i = ecg_class.einthoven_I
-        einthoven_ii = ecg_class.einthoven_II
-        einthoven_iii = ecg_class.einthoven_III
-
-        # getting filtered ECG data numpy arrays from class
-        ecg_class.filter_data()
-        chest_strap_V2_V1_filt = ecg_class.cs_V2_V1_filt
-        einthoven_i_filt = ecg_class.einthoven_I_filt
-        einthoven_ii_filt = ecg_class.einthoven_II_filt
-        einthoven_iii_filt = ecg_class.einthoven_III_filt
-
-        data = einthoven_ii
-
-        if ecg_class.anno_cables_exists:
-            data_anno = ecg_class.anno_cables
-            exist=True
+        exist = data_anno is not None
 
         #%% Detection
 
@@ -93,11 +82,16 @@ for detector in detectors.detector_list:
                             interval_results[jmx_analysis.key_accuracy],
                             
             ])
-            jmx_results = np.vstack( (jmx_results,jmx) )
-            jmx_avg = np.average(jmx_results,axis=0)
+            averages.update("all", interval_results)
+            averages.update((detectorname, recording_leads, experiment), interval_results)
+            jmx_avg = (averages.mean("all", jmx_analysis.key_jitter), averages.mean("all", jmx_analysis.key_accuracy))
             s = jmx_analysis.score(jmx_avg[0],jmx_avg[1])
             print("Current avg: J = {:1.6f} sec, A = {:1.6f}, JMX = {:1.4f}".format(jmx_avg[0],jmx_avg[1],s))
             f.write("{}\t{}\t{}\t{}\n".format(jmx[0],jmx[1],jmx_avg[0],jmx_avg[1]))
             f.flush()
 print("FINAL Avg: J = {:1.6f} sec, A = {:1.6f}".format(jmx_avg[0],jmx_avg[1]))
 f.close()
+
+averages.print_summary(jmx_analysis.key_jitter)
+averages.print_summary(jmx_analysis.key_accuracy)
+averages.print_summary(jmx_analysis.key_jmx)
@@ -3,7 +3,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import scipy.stats as stats
 from ecgdetectors import Detectors
-import json
+import results_store
+import datasets
 
 experiment_names = ['sitting','maths','walking','hand_bike','jogging']
 
@@ -20,15 +21,19 @@ alpha = 0.05
 
 minjmx = 90 # %
 
+# all results in one columnar store (built from the json files if needed)
+store = results_store.load("jmx", det_names, datasets.GUDB.subjects)
+
+# cost of the detectors per recording (wall/CPU time, samples/sec, peak memory)
+try:
+    cost_store = results_store.load("cost", det_names, datasets.GUDB.subjects)
+except OSError:
+    cost_store = None # results from a run without cost measurement
+
 def get_jmx(detector_name, leads, experiment):
-    f = open(resultsdir+"/jmx_"+detector_name+".json","r")
-    js = f.read()
-    data = json.loads(js)
-    s = []
-    for i in data[leads][experiment]:
-        if i["jmx"]:
-            s.append(i["jmx"]*100)
-    return np.array(s)
+    s = store.query("jmx", detector_name, leads, experiment)
+    s = s[(s != 0) & ~np.isnan(s)] # recordings without a score
+    return s*100
 
 
 def get_result(det, leads, experiment):
@@ -36,13 +41,62 @@ def get_result(det, leads, experiment):
     m = []
     s = []
     for det in det_names:
-        print(det,experiment,get_jmx(det, leads, experiment))
-        m.append(np.mean(get_jmx(det, leads, experiment)))
-        s.append(np.std(get_jmx(det, leads, experiment)))
+        r = get_jmx(det, leads, experiment)
+        print(det,experiment,r)
+        m.append(np.mean(r))
+        s.append(np.std(r))
 
     return np.array(m),np.array(s)
 
 
+def get_cost(leads, column):
+    """Median of a cost column of every detector over all experiments."""
+    return np.array([np.median(cost_store.query(column, det, leads)) for det in det_names])
+
+
+def print_cost(leads):
+    print("Detector cost:",leads)
+    print("{:30s} {:>12s} {:>12s} {:>14s} {:>10s}".format("", "wall (s)", "CPU (s)", "samples/sec", "MB"))
+    wall = get_cost(leads, "wall_time")
+    cpu = get_cost(leads, "cpu_time")
+    throughput = get_cost(leads, "samples_per_sec")
+    memory = get_cost(leads, "peak_memory")
+    for i in zip(det_names, wall, cpu, throughput, memory):
+        print("{:30s} {:12.4f} {:12.4f} {:14.0f} {:10.2f}".format(i[0], i[1], i[2], i[3], i[4] / 1E6)) # nan: memory not measured
+    print()
+
+
+def pareto_front(cost, score):
+    """Indices of the detectors which no other detector beats in both throughput and score."""
+    front = []
+    for i in range(len(cost)):
+        if not np.any((cost >= cost[i]) & (score >= score[i]) & ((cost > cost[i]) | (score > score[i]))):
+            front.append(i)
+    return sorted(front, key = lambda i: cost[i])
+
+
+def pareto_plot(leads, jmx1, jmx2, legend1, legend2, title=None):
+    """JMX against the throughput of the detectors with the Pareto fronts."""
+    throughput = get_cost(leads, "samples_per_sec")
+    fig, ax = plt.subplots()
+    fig.set_size_inches(10, 7)
+    for jmx, legend in ((jmx1, legend1), (jmx2, legend2)):
+        points = ax.scatter(throughput, jmx, alpha=0.5, label=legend)
+        front = pareto_front(throughput, jmx)
+        ax.plot(throughput[front], jmx[front], color=points.get_facecolor()[0], alpha=0.5)
+        for name, x, y in zip(plot_names, throughput, jmx):
+            ax.annotate(name, (x, y), fontsize=8)
+    ax.set_xscale('log')
+    ax.set_xlabel('Throughput (samples/sec)')
+    ax.set_ylabel('JMX (%)')
+    ax.legend()
+
+    if title!=None:
+        ax.set_title(title)
+
+    plt.tight_layout()
+
+
 def print_stat(p):
     if p == None:
         print('--- & ',end='')
@@ -122,6 +176,17 @@ double_plot(cs_sitting_avg, cs_sitting_std,
 
 
 
+if cost_store is not None:
+    print_cost(einth)
+    print_cost(cs)
+
+    pareto_plot(einth, einthoven_sitting_avg, einthoven_jogging_avg,
+                'Sitting', 'Jogging', 'Einthoven: accuracy vs cost')
+
+    pareto_plot(cs, cs_sitting_avg, cs_jogging_avg,
+                'Sitting', 'Jogging', 'Chest strap: accuracy vs cost')
+
+
 calc_stats(einth,"sitting")
 calc_stats(einth,"jogging")
 
@@ -0,0 +1,200 @@
+"""
+Streaming JMX analysis
+======================
+Scores a detector like jmx_analysis.evaluate but the detections and
+annotations are fed in time ordered chunks so that arbitrarily long
+recordings (or live device logs) never need to be held in memory.
+
+    ev = StreamingEvaluator(fs)
+    for det_chunk, anno_chunk in chunks:
+        ev.update(det_chunk, anno_chunk)
+    jmx = ev.finalize(nSamples)
+
+Only a window of pending annotations and detections around the last
+matched beat, the counts and a histogram of the pair differences are
+kept. The detector delay is estimated from the first delay_warmup
+detections (or set with delay). If the whole recording fits into the
+warm up the result is the same as jmx_analysis.evaluate.
+"""
+
+import numpy as np
+import util
+import jmx_analysis
+from jmx_analysis import key_jitter, key_tp, key_tn, key_fp, key_fn, key_accuracy, key_jmx
+
+def nearest_index(annotation, detection):
+    # index of the nearest detection of every annotation, the first one
+    # on a tie (same rule as jmx_analysis.match_beats), detection sorted
+    right = np.searchsorted(detection, annotation, side='left')
+    left = np.maximum(right - 1, 0)
+    right = np.minimum(right, len(detection) - 1)
+    left = np.searchsorted(detection, detection[left], side='left')
+    take_left = np.abs(detection[left] - annotation) <= np.abs(detection[right] - annotation)
+    return np.where(take_left, left, right)
+
+
+class StreamingEvaluator:
+
+    def __init__(self, fs, trim = True, delay = None, delay_warmup = 1000):
+        """
+        fs: sampling rate
+        trim: trims the annotations like jmx_analysis.evaluate (a and b)
+        delay: detector delay in samples, estimated from the warm up if None
+        delay_warmup: number of detections used to estimate the delay
+        """
+        self.fs = fs
+        self.trim = trim
+        self.delay = delay
+        self.delay_warmup = delay_warmup
+        # number of annotations to trim from start / end (None: no trimming)
+        self.a = jmx_analysis.a if trim else 0
+        self.b = jmx_analysis.b if trim else None
+
+        # raw input during the warm up
+        self.warmup_det = []
+        self.warmup_anno = []
+
+        # annotations which are not yet known to be inside the trimmed range
+        self.anno_buf = np.empty(0, dtype=np.int64)
+        self.n_anno = 0 # annotations seen
+        self.last_released = None # last annotation inside the trimmed range
+        self.start_posn = None if self.a > 0 else -np.inf
+        self.end_posn = -np.inf if self.b is not None else np.inf
+
+        # detections which are not yet known to be inside the trimmed range
+        self.det_buf = np.empty(0, dtype=np.int64)
+
+        # pending window for the matching
+        self.pa = np.empty(0, dtype=np.int64)
+        self.pd = np.empty(0, dtype=np.int64)
+
+        self.n_anno_trimmed = 0
+        self.n_det_trimmed = 0
+        self.tp = 0
+        self.diffs = util.StreamingMedian()
+
+    def update(self, det_posn = (), anno_R = ()):
+        """Adds the next chunk of detections and/or annotations (in samples)."""
+        if self.delay is None:
+            self.warmup_det.append(np.asarray(det_posn, dtype=np.int64))
+            self.warmup_anno.append(np.asarray(anno_R, dtype=np.int64))
+            if sum(len(d) for d in self.warmup_det) >= self.delay_warmup:
+                self._end_warmup()
+            return
+        self._add_annotations(np.asarray(anno_R, dtype=np.int64))
+        self._add_detections(np.asarray(det_posn, dtype=np.int64) - self.delay)
+        self._match()
+
+    def _end_warmup(self):
+        det_posn = np.concatenate(self.warmup_det)
+        anno_R = np.concatenate(self.warmup_anno)
+        self.warmup_det = []
+        self.warmup_anno = []
+        # Median delay of the detection against the annotations
+        self.delay = util.calcMedianDelay(det_posn, anno_R)
+        self.update(det_posn, anno_R)
+
+    def _add_annotations(self, anno_R):
+        if len(anno_R) == 0:
+            return
+        self.anno_buf = np.concatenate((self.anno_buf, anno_R))
+        first = self.n_anno - len(self.anno_buf) + len(anno_R) # index of anno_buf[0]
+        self.n_anno += len(anno_R)
+
+        # detections start half an interval before annotation a
+        if self.start_posn is None and self.n_anno > self.a:
+            i = self.a - first
+            self.start_posn = int((self.anno_buf[i]+self.anno_buf[i-1])/2)
+
+        # annotations up to index n+b are inside the trimmed range for sure
+        if self.b is None:
+            released = len(self.anno_buf)
+        else:
+            released = max(self.n_anno + self.b + 1 - first, 0)
+        if released > 0:
+            r = self.anno_buf[max(self.a - first, 0):released]
+            self.pa = np.concatenate((self.pa, r))
+            self.n_anno_trimmed += len(r)
+            self.last_released = self.anno_buf[released-1]
+            self.anno_buf = self.anno_buf[released:]
+
+        # the final end position can only be later than this one
+        if self.b is not None and self.last_released is not None and len(self.anno_buf) > 0:
+            self.end_posn = int((self.last_released+self.anno_buf[0])/2)
+        self._add_detections(np.empty(0, dtype=np.int64))
+
+    def _add_detections(self, det_posn):
+        self.det_buf = np.concatenate((self.det_buf, det_posn))
+        if self.start_posn is None:
+            return
+        self.det_buf = self.det_buf[self.det_buf >= self.start_posn]
+        n = np.searchsorted(self.det_buf, self.end_posn, side='right')
+        self.pd = np.concatenate((self.pd, self.det_buf[:n]))
+        self.n_det_trimmed += int(n)
+        self.det_buf = self.det_buf[n:]
+
+    def _commit(self, diffs):
+        self.tp += len(diffs)
+        self.diffs.add(diffs)
+
+    def _match(self):
+        if len(self.pd) == 0:
+            return
+        # annotations up to the last detection have their final nearest detection
+        k = np.searchsorted(self.pa, self.pd[-1], side='right')
+        if k == 0:
+            return
+        nearest = nearest_index(self.pa[:k], self.pd)
+        last = nearest[-1]
+        # all detections before the last one won't get any more annotations
+        closed = np.count_nonzero(nearest < last)
+        self._commit(jmx_analysis.match_beats(self.pa[:closed], self.pd[:last])[2])
+        self.pa = self.pa[closed:]
+        self.pd = self.pd[last:]
+
+    def finalize(self, nSamples):
+        """
+        Matches the remaining beats and returns the same jmx dict
+        as jmx_analysis.evaluate.
+        nSamples: number of samples of the recording
+        """
+        if self.delay is None:
+            self._end_warmup()
+
+        # the end of the recording fixes the trimmed range
+        if self.b is not None:
+            self.anno_buf = np.empty(0, dtype=np.int64)
+        self.end_posn = np.inf if self.b is None else self.end_posn
+        self._add_detections(np.empty(0, dtype=np.int64))
+        self.det_buf = np.empty(0, dtype=np.int64)
+
+        self._commit(jmx_analysis.match_beats(self.pa, self.pd)[2])
+        self.pa = np.empty(0, dtype=np.int64)
+        self.pd = np.empty(0, dtype=np.int64)
+
+        # Do we have enough detections?
+        if self.n_det_trimmed<=10:
+            warning='WARNING: Less than ten detections'
+            print(warning)
+
+        jmx = {}
+
+        jmx[key_jitter] = jmx_analysis.mad_scale * self.diffs.mad() / self.fs
+        tp = self.tp
+        fp = self.n_det_trimmed - tp # all detections - true positive = false positive
+        fn = self.n_anno_trimmed - tp # all detections
+        maxBeats = nSamples / self.fs * jmx_analysis.maxHR / 60
+        tn = maxBeats - (tp + fn + fp) # remaining samples
+        jmx[key_tp] = tp
+        jmx[key_tn] = tn
+        jmx[key_fp] = fp
+        jmx[key_fn] = fn
+        if (tp + tn + fp + fn) > 0:
+            accuracy = (tp + tn)/(tp + tn + fp + fn)
+            jmx[key_accuracy] = accuracy
+            jmx[key_jmx] = jmx_analysis.score(jmx[key_jitter],accuracy)
+        else:
+            jmx[key_accuracy] = False
+            jmx[key_jmx] = False
+        print(jmx)
+        return jmx
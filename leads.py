@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Lead registry of the GUDB recordings
+====================================
+Maps every lead name used in the results (raw and filtered) to the
+function which computes it and to the source of its annotations
+(the cables or the chest strap). The leads of a recording are only
+computed when they are requested and then kept, so that for example
+einthoven_ii_filt filters only Einthoven II and not all four channels
+as GUDb.filter_data() does.
+
+    recording = leads.Recording(CachedGUDb(subject_number, experiment))
+    data = recording["einthoven_ii"]
+    data_anno = recording.annotations("einthoven_ii") # None if there are none
+"""
+
+import scipy.signal as signal
+
+
+def highpass_bandstop(fs):
+    """Same filters as GUDb.filter_data: highpass at 0.1Hz and bandstop 48-52Hz."""
+    b_dc, a_dc = signal.butter(4, (0.1/fs*2), btype='highpass')
+    b_50, a_50 = signal.butter(4, [(48/fs*2),(52/fs*2)], btype='stop')
+    return b_dc, a_dc, b_50, a_50
+
+
+def filtered(lead):
+    """Lead function of the filtered version of a lead."""
+    def compute(recording):
+        b_dc, a_dc, b_50, a_50 = recording.filters()
+        return signal.lfilter(b_50, a_50, signal.lfilter(b_dc, a_dc, recording[lead]))
+    return compute
+
+
+# lead name -> (function of the Recording returning the array, annotation source)
+registry = {
+    "chest_strap_V2_V1" : (lambda r: r.ecg_class.data[:, 0], "cs"),
+    "einthoven_ii" : (lambda r: r.ecg_class.data[:, 1], "cables"),
+    "einthoven_iii" : (lambda r: r.ecg_class.data[:, 2], "cables"),
+    "einthoven_i" : (lambda r: r["einthoven_ii"] - r["einthoven_iii"], "cables"),
+    "chest_strap_V2_V1_filt" : (filtered("chest_strap_V2_V1"), "cs"),
+    "einthoven_ii_filt" : (filtered("einthoven_ii"), "cables"),
+    "einthoven_iii_filt" : (filtered("einthoven_iii"), "cables"),
+    # as GUDb.filter_data: the difference of the filtered leads
+    "einthoven_i_filt" : (lambda r: r["einthoven_ii_filt"] - r["einthoven_iii_filt"], "cables"),
+}
+
+# annotation source -> (attribute if they exist, attribute of the annotations) of GUDb
+annotation_sources = {
+    "cables" : ("anno_cables_exists", "anno_cables"),
+    "cs" : ("anno_cs_exists", "anno_cs"),
+}
+
+
+class Recording:
+    """Lazily computed and memoised leads of a GUDb recording."""
+
+    def __init__(self, ecg_class):
+        self.ecg_class = ecg_class
+        self.arrays = {}
+        self.coefficients = None
+
+    def filters(self):
+        if self.coefficients is None:
+            self.coefficients = highpass_bandstop(self.ecg_class.fs)
+        return self.coefficients
+
+    def __getitem__(self, lead):
+        if lead not in self.arrays:
+            self.arrays[lead] = registry[lead][0](self)
+        return self.arrays[lead]
+
+    def annotation_source(self, lead):
+        return registry[lead][1]
+
+    def annotations(self, lead):
+        """The annotations belonging to a lead or None if they don't exist."""
+        exists, anno = annotation_sources[registry[lead][1]]
+        if getattr(self.ecg_class, exists):
+            return getattr(self.ecg_class, anno)
+        return None
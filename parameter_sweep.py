@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Parameter sweep of the scores
+=============================
+The JMX and sensitivity scores depend on the constants norm_jitter,
+maxHR and the trimming (a, b) in jmx_analysis and the tolerance of the
+sensitivity analysis (fs/10). Instead of rerunning the whole benchmark
+for every setting the delay corrected anno/detection pair distances of
+every recording are computed once per trim setting and kept in
+results/sweep_matches_*.npz. The scores are then recomputed from these
+distances for the whole grid of parameters at once.
+
+python parameter_sweep.py [detector ...] [--param p=v1,v2] [--trim 10:-5 none]
+    [--norm-jitter 0.008 0.012] [--max-hr 200 220] [--tolerance 0.05 0.1]
+
+The results are written as tidy tables with one row per detector, lead,
+experiment and parameter setting (mean and standard deviation over the
+subjects):
+results/sweep_jmx.tsv
+results/sweep_sens.tsv
+The stored distances are reused as long as they were built for the
+same dataset, detectors (and their versions), leads, experiments and
+subjects; otherwise they are rebuilt. --rebuild forces it.
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+from ecgdetectors import Detectors
+
+import benchmark
+import detector_registry
+import datasets
+import detection_cache
+import util
+import jmx_analysis
+import sensitivity_analysis
+
+# default grids
+trims = [(jmx_analysis.a, jmx_analysis.b), None] # None: no trimming
+norm_jitters = [4E-3, 6E-3, 8E-3, 10E-3, 12E-3, 16E-3, 20E-3] # s
+maxHRs = [180, 200, 220, 240] # bpm
+tolerances = [0.02, 0.04, 0.06, 0.08, 0.1, 0.12, 0.15, 0.2] # s
+
+
+def match(det_posn, anno_R, trim):
+    """
+    Delay corrected anno/detection pair distances of a recording in samples
+    as in jmx_analysis.evaluate. trim: (a, b) or None
+    returns (diffs, number of detections, number of annotations) after trimming
+    """
+    delay_correction = util.calcMedianDelay(det_posn, anno_R)
+    det_posn = np.array(det_posn)-int(delay_correction)
+    if trim is not None:
+        det_posn, anno_R = util.trim_after_detection(det_posn, anno_R, trim[0], trim[1])
+    return jmx_analysis.nearest_diff(anno_R, det_posn), len(det_posn), len(anno_R)
+
+
+def matches_file(trim):
+    """File of the pair distances of a trim setting ("sens": sensitivity)."""
+    if trim == "sens":
+        name = "sens"
+    elif trim is None:
+        name = "none"
+    else:
+        name = "a{}_b{}".format(*trim)
+    return benchmark.resultsdir+"/sweep_matches_"+name+".npz"
+
+
+def parse_trim(s):
+    """a:b or none"""
+    if s == "none":
+        return None
+    a, b = s.split(":")
+    return (int(a), int(b))
+
+
+def selection_text(detector_list, leads, experiments, subjects):
+    """Description of what the pair distances are computed from (stored with them)."""
+    return json.dumps({"dataset" : benchmark.dataset.name,
+                       "detectors" : [[detector[1].__name__, detection_cache.detector_id(detector[1])]
+                                      for detector in detector_list],
+                       "leads" : list(leads),
+                       "experiments" : list(experiments),
+                       "subjects" : [str(s) for s in subjects]})
+
+
+def matches_current(trims, selection):
+    """True if the pair distances of all trims exist and were built for selection."""
+    for trim in trims + ["sens"]:
+        try:
+            with np.load(matches_file(trim)) as f:
+                if "selection" not in f.files or str(f["selection"]) != selection:
+                    return False
+        except OSError:
+            return False
+    return True
+
+
+def build_matches(detector_list, leads, experiments, subjects, trims):
+    """
+    Runs (or loads from the detection cache) all detectors over all
+    recordings and stores the pair distances for every trim setting
+    and for the sensitivity analysis.
+    """
+    keys = []
+    nSamples = []
+    matches = {trim : ([], [], []) for trim in trims + ["sens"]}
+    for experiment in experiments:
+        for subject_number in subjects:
+            for record_lead in leads:
+                recording = benchmark.dataset.load(subject_number, experiment, record_lead)
+                if recording is None: # only proceed if an annotation exists
+                    continue
+                data, data_anno, fs, metadata = recording
+                if not isinstance(subject_number, int):
+                    # named records (WFDB) are stored by their position
+                    subject_number = list(subjects).index(subject_number)
+                for detector in detector_list:
+                    print("Matching subject {}, {}, {}, {}".format(subject_number, experiment, record_lead, detector[0]))
+                    detected_peaks = detection_cache.detect(detector, data, fs)
+                    keys.append((detector[1].__name__, record_lead, experiment, subject_number))
+                    nSamples.append(len(data))
+                    for trim in trims:
+                        for l, v in zip(matches[trim], match(detected_peaks, data_anno, trim)):
+                            l.append(v)
+                    for l, v in zip(matches["sens"], sensitivity_analysis.distances(detected_peaks, data_anno)):
+                        l.append(v)
+
+    for trim, (diffs, n_det, n_anno) in matches.items():
+        filename = matches_file(trim)
+        tmp = filename[:-4] + ".%d.npz" % os.getpid()
+        np.savez(tmp,
+                 detector = np.array([k[0] for k in keys], dtype=str),
+                 lead = np.array([k[1] for k in keys], dtype=str),
+                 experiment = np.array([k[2] for k in keys], dtype=str),
+                 subject = np.array([k[3] for k in keys], dtype=int),
+                 diffs = np.concatenate(diffs) if diffs else np.empty(0, dtype=np.int64),
+                 offsets = np.r_[0, np.cumsum([len(d) for d in diffs], dtype=np.int64)],
+                 n_det = np.array(n_det, dtype=np.int64),
+                 n_anno = np.array(n_anno, dtype=np.int64),
+                 nSamples = np.array(nSamples, dtype=np.int64),
+                 selection = np.array(selection_text(detector_list, leads, experiments, subjects)))
+        os.replace(tmp, filename)
+
+
+def load_matches(trim):
+    with np.load(matches_file(trim)) as f:
+        return {c : f[c] for c in f.files}
+
+
+def sweep_jmx(m, fs, norm_jitters, maxHRs):
+    """
+    JMX of every recording for all norm_jitter x maxHR combinations.
+    m: pair distances of one trim setting (load_matches)
+    returns jitter (recordings), accuracy (recordings, maxHRs),
+    jmx (recordings, norm_jitters, maxHRs)
+    """
+    n_rec = len(m["n_det"])
+    tp = np.diff(m["offsets"])
+    rec = np.repeat(np.arange(n_rec), tp)
+
+    # median absolute deviation (scaled like scipy's median_absolute_deviation)
+    differences_for_jitter = np.abs(m["diffs"] / fs)
+    med = util.segmentMedian(differences_for_jitter, rec, n_rec)
+    mad = util.segmentMedian(np.abs(differences_for_jitter - med[rec]), rec, n_rec)
+    jitter = jmx_analysis.mad_scale * mad
+
+    fp = (m["n_det"] - tp)[:, None] # all detections - true positive = false positive
+    fn = (m["n_anno"] - tp)[:, None] # all detections
+    tp = tp[:, None]
+    maxBeats = m["nSamples"][:, None] / fs * np.asarray(maxHRs, dtype=float)[None, :] / 60
+    tn = maxBeats - (tp + fn + fp) # remaining samples
+    total = tp + tn + fp + fn
+    with np.errstate(invalid='ignore', divide='ignore'):
+        accuracy = np.where(total > 0, (tp + tn) / total, np.nan)
+
+    jitter_score = jmx_analysis.mapping_jitter(jitter[:, None] / np.asarray(norm_jitters)[None, :])
+    jmx = accuracy[:, None, :] * jitter_score[:, :, None]
+    return jitter, accuracy, jmx
+
+
+def sweep_sensitivity(m, fs, tolerances):
+    """
+    Sensitivity, TP, FP and FN of every recording for all tolerances (s).
+    returns arrays (recordings, tolerances)
+    """
+    n_rec = len(m["n_det"])
+    rec = np.repeat(np.arange(n_rec), np.diff(m["offsets"]))
+    tp = np.stack([np.bincount(rec[m["diffs"] <= tol * fs + 1E-9], minlength=n_rec)
+                   for tol in tolerances], axis=1)
+    fp = m["n_det"][:, None] - tp
+    fn = m["n_anno"][:, None] - tp
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sensitivity = np.where(tp + fn > 0, tp/(tp+fn)*100.0, np.nan)
+    return sensitivity, tp, fp, fn
+
+
+def groups(m):
+    """Sort order of the recordings and start of every detector/lead/experiment group."""
+    order = np.lexsort((m["subject"], m["experiment"], m["lead"], m["detector"]))
+    key = np.char.add(np.char.add(np.char.add(m["detector"][order], "\0"),
+                                  np.char.add(m["lead"][order], "\0")), m["experiment"][order])
+    start = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    return order, start
+
+
+def group_stats(values, order, start):
+    """Mean, standard deviation and count of the non-NaN values per group (along axis 0)."""
+    v = values[order]
+    valid = ~np.isnan(v)
+    v = np.where(valid, v, 0)
+    n = np.add.reduceat(valid, start, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.add.reduceat(v, start, axis=0) / n
+        std = np.sqrt(np.maximum(np.add.reduceat(v * v, start, axis=0) / n - mean * mean, 0))
+    return mean, std, n
+
+
+def write_jmx_table(filename, fs, trims, norm_jitters, maxHRs):
+    with open(filename,"w") as f:
+        f.write("\t".join(["detector", "lead", "experiment", "a", "b", "norm_jitter", "maxHR",
+                           "n", "jitter", "accuracy", "jmx", "jmx_std"]) + "\n")
+        for trim in trims:
+            m = load_matches(trim)
+            order, start = groups(m)
+            jitter, accuracy, jmx = sweep_jmx(m, fs, norm_jitters, maxHRs)
+            jitter_mean = group_stats(jitter, order, start)[0]
+            accuracy_mean = group_stats(accuracy, order, start)[0]
+            jmx_mean, jmx_std, n = group_stats(jmx, order, start)
+            a, b = ("", "") if trim is None else trim
+            for g, s in enumerate(start):
+                i = order[s]
+                for j, norm_jitter in enumerate(norm_jitters):
+                    for h, maxHR in enumerate(maxHRs):
+                        f.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{:.6g}\t{:.6g}\t{:.6g}\t{:.6g}\n".format(
+                            m["detector"][i], m["lead"][i], m["experiment"][i], a, b, norm_jitter, maxHR,
+                            n[g, j, h], jitter_mean[g], accuracy_mean[g, h], jmx_mean[g, j, h], jmx_std[g, j, h]))
+
+
+def write_sens_table(filename, fs, tolerances):
+    m = load_matches("sens")
+    order, start = groups(m)
+    sensitivity, tp, fp, fn = sweep_sensitivity(m, fs, tolerances)
+    sens_mean, sens_std, n = group_stats(sensitivity, order, start)
+    tp = np.add.reduceat(tp[order], start, axis=0)
+    fp = np.add.reduceat(fp[order], start, axis=0)
+    fn = np.add.reduceat(fn[order], start, axis=0)
+    with open(filename,"w") as f:
+        f.write("\t".join(["detector", "lead", "experiment", "tolerance",
+                           "n", "sensitivity", "sensitivity_std", "TP", "FP", "FN"]) + "\n")
+        for g, s in enumerate(start):
+            i = order[s]
+            for t, tol in enumerate(tolerances):
+                f.write("{}\t{}\t{}\t{}\t{}\t{:.6g}\t{:.6g}\t{}\t{}\t{}\n".format(
+                    m["detector"][i], m["lead"][i], m["experiment"][i], tol,
+                    n[g, t], sens_mean[g, t], sens_std[g, t], tp[g, t], fp[g, t], fn[g, t]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("detector", nargs="*",
+                        help="index or name of a detector or module:function (default: all)")
+    parser.add_argument("--param", nargs="+",
+                        help="parameter grid of the detectors: parameter=value1,value2,...")
+    parser.add_argument("--dataset", default="gudb",
+                        help="gudb, gudb:<path>, wfdb:<path>[:<annotator>] or synthetic[:<subjects>]")
+    parser.add_argument("--trim", nargs="+", default=["{}:{}".format(*t) if t else "none" for t in trims],
+                        help="trim settings a:b (annotations trimmed from start:end) or none")
+    parser.add_argument("--norm-jitter", type=float, nargs="+", default=norm_jitters, help="norm_jitter in s")
+    parser.add_argument("--max-hr", type=float, nargs="+", default=maxHRs, help="maxHR in bpm")
+    parser.add_argument("--tolerance", type=float, nargs="+", default=tolerances, help="sensitivity tolerance in s")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the stored pair distances")
+    args = parser.parse_args()
+
+    benchmark.use_dataset(datasets.from_name(args.dataset))
+    detectors = Detectors(benchmark.fs) # Initialise detectors for the sampling rate of the dataset
+
+    # every combination of the parameters is evaluated as a detector of its own
+    detector_registry.register_detectors(detectors)
+    detector_list = detector_registry.detector_list(args.detector, detector_registry.parse_grid(args.param))
+    detector_registry.save_index(detector_list, benchmark.resultsdir)
+
+    trims = [parse_trim(t) for t in args.trim]
+    leads, experiments, subjects = benchmark.selection(None, None, None)
+    if args.rebuild or not matches_current(trims, selection_text(detector_list, leads, experiments, subjects)):
+        build_matches(detector_list, leads, experiments, subjects, trims)
+
+    write_jmx_table(benchmark.resultsdir+"/sweep_jmx.tsv", benchmark.fs, trims, args.norm_jitter, args.max_hr)
+    write_sens_table(benchmark.resultsdir+"/sweep_sens.tsv", benchmark.fs, args.tolerance)
+    print("Written:", benchmark.resultsdir+"/sweep_jmx.tsv", benchmark.resultsdir+"/sweep_sens.tsv")
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Prefetching of recordings
+=========================
+Loading a recording (download, parsing, filtering) and running the
+detectors over it use different resources, so the next recordings are
+loaded by a thread pool while the current one is processed:
+
+    for key, recording in prefetch.prefetch(load, keys):
+        ...
+
+load(key) is called for every key in a background thread and the
+results are returned in the order of keys. At most 'depth' recordings
+are loaded ahead (bounded memory). An exception of load() is raised
+when its recording is reached.
+"""
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+depth = 4 # recordings which are loaded ahead
+threads = 2 # parallel loads
+
+
+def prefetch(load, keys, depth = depth, threads = threads):
+    """Generator of (key, load(key)) for all keys, loading up to depth keys ahead."""
+    keys = iter(keys)
+    with ThreadPoolExecutor(max_workers = threads) as executor:
+        pending = collections.deque()
+        try:
+            for key in keys:
+                pending.append((key, executor.submit(load, key)))
+                if len(pending) >= depth:
+                    break
+            while pending:
+                key, future = pending.popleft()
+                # keeps the queue filled while the caller works on this one
+                for next_key in keys:
+                    pending.append((next_key, executor.submit(load, next_key)))
+                    break
+                yield key, future.result()
+        finally:
+            # stopped early or failed: don't load the rest
+            for key, future in pending:
+                future.cancel()
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Real-time replay of the recordings
+==================================
+The JMX analysis removes the median delay of a detector so it doesn't
+say how late a beat is reported when the detector runs on live data.
+This script replays every recording in chunks of chunk_duration at a
+simulated sample clock. After every chunk the detector runs over the
+last window_duration seconds and every beat in the last max_latency
+seconds which hasn't been reported before is emitted at the time of the
+end of the chunk. Beats which a detector only finds later than that
+would be useless in a live pipeline and count as not detected.
+
+The latency of a beat is the time from its annotated R peak until it's
+emitted (which includes the waiting time for the chunk). Emitted beats
+are matched to the annotations after removing the median delay with the
+same matching as the JMX analysis. For every detector the median, 95th
+and 99th percentile of the latency and the processing time per chunk
+are reported together with the share of the annotated beats which
+were reported in time. A detector meets the real-time budget if the 99th
+percentile of the processing time is below the chunk duration.
+
+python realtime_replay.py [detector ...] [--param p=v1,v2] [--chunk 0.1] [--window 10]
+
+The results are stored in results/realtime_<detector>.json.
+"""
+
+import time
+import json
+import argparse
+import numpy as np
+from ecgdetectors import Detectors
+
+import benchmark
+import detector_registry
+import datasets
+import util
+import jmx_analysis
+
+chunk_duration = 0.1 # s, samples delivered at once by the device
+window_duration = 10 # s, history the detector runs on
+max_latency = 1 # s, beats found later than this are not reported
+tolerance = 0.1 # s, max distance of an emitted beat to its annotation
+
+
+def replay(detector, data, fs, chunk, window, latest, tol):
+    """
+    Replays data in chunks of chunk samples through the detector which
+    runs on the last window samples. Only detections in the last latest
+    samples are reported.
+    returns:
+    detections  : positions of the reported beats in samples
+    emitted     : sample clock when each beat was reported
+    chunk_times : processing time of every chunk in s
+    errors      : number of chunks where the detector failed
+    """
+    detections = np.empty(0, dtype=np.int64)
+    emitted = np.empty(0, dtype=np.int64)
+    chunk_times = []
+    errors = 0
+
+    for t in range(chunk, len(data) + chunk, chunk):
+        t = min(t, len(data))
+        start = max(t - window, 0)
+        t0 = time.perf_counter()
+        try:
+            found = np.asarray(detector[1](data[start:t]), dtype=np.int64) + start
+        except (IndexError, ValueError):
+            # some detectors fail on short windows or if there are no beats
+            found = np.empty(0, dtype=np.int64)
+            errors += 1
+        chunk_times.append(time.perf_counter() - t0)
+
+        found = found[found >= t - latest]
+        # beats which were already reported (at a slightly different position)
+        if len(detections) > 0 and len(found) > 0:
+            i = np.clip(np.searchsorted(detections, found), 1, len(detections))
+            nearest = np.minimum(np.abs(found - detections[i - 1]),
+                                 np.abs(found - detections[np.minimum(i, len(detections) - 1)]))
+            found = found[nearest > tol]
+        if len(found) > 0:
+            found = np.unique(found)
+            i = np.searchsorted(detections, found)
+            detections = np.insert(detections, i, found)
+            emitted = np.insert(emitted, i, t)
+
+    return detections, emitted, np.array(chunk_times), errors
+
+
+def latencies(detections, emitted, anno, fs, tol):
+    """Latencies in s of the emitted beats which match an annotation."""
+    if len(detections) == 0 or len(anno) == 0:
+        return np.empty(0)
+    anno = np.asarray(anno, dtype=np.int64)
+    delay = util.calcMedianDelay(detections, anno)
+    anno_index, det_index, diffs, missed, extra = jmx_analysis.match_beats(anno, detections - delay)
+    ok = diffs <= tol
+    return (emitted[det_index[ok]] - anno[anno_index[ok]]) / fs
+
+
+def replay_detector(detector, leads, experiments, subjects):
+    """
+    Replays all recordings through the detector.
+    Returns the latencies and chunk times of all recordings, the
+    number of failed chunks and the number of annotated beats
+    (empty arrays if no recording has annotations).
+    """
+    fs = benchmark.fs
+    chunk = int(round(chunk_duration * fs))
+    window = int(round(window_duration * fs))
+    latest = int(round(max_latency * fs))
+    tol = int(round(tolerance * fs))
+
+    all_latencies = []
+    all_chunk_times = []
+    errors = 0
+    n_anno = 0
+    for experiment in experiments:
+        for subject_number in subjects:
+            for record_lead in leads:
+                recording = benchmark.dataset.load(subject_number, experiment, record_lead)
+                if recording is None: # only proceed if an annotation exists
+                    continue
+                data, data_anno, fs, metadata = recording
+                print("Replaying subject {}, {}, {}, {}".format(subject_number, experiment, record_lead, detector[0]))
+                detections, emitted, chunk_times, e = replay(detector, np.asarray(data), fs, chunk, window, latest, tol)
+                all_latencies.append(latencies(detections, emitted, data_anno, fs, tol))
+                all_chunk_times.append(chunk_times)
+                errors += e
+                n_anno += len(data_anno)
+    return (np.concatenate([np.empty(0)] + all_latencies), np.concatenate([np.empty(0)] + all_chunk_times),
+            errors, n_anno)
+
+
+def summary(latency, chunk_times, errors, n_anno):
+    """The chunk times and realtime are None if nothing was replayed."""
+    return {
+        "beats" : len(latency),
+        "detected" : len(latency) / n_anno if n_anno else None,
+        "latency_median" : float(np.median(latency)) if len(latency) else None,
+        "latency_p95" : float(np.percentile(latency, 95)) if len(latency) else None,
+        "latency_p99" : float(np.percentile(latency, 99)) if len(latency) else None,
+        "chunk_duration" : chunk_duration,
+        "max_latency" : max_latency,
+        "chunk_time_median" : float(np.median(chunk_times)) if len(chunk_times) else None,
+        "chunk_time_p99" : float(np.percentile(chunk_times, 99)) if len(chunk_times) else None,
+        "chunk_time_max" : float(np.max(chunk_times)) if len(chunk_times) else None,
+        "failed_chunks" : errors,
+        "realtime" : bool(np.percentile(chunk_times, 99) < chunk_duration) if len(chunk_times) else None,
+    }
+
+
+def print_summary(results):
+    print("{:30s} {:>9s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s} {:>8s} {:>9s}".format(
+        "latency (ms)", "detected", "median", "p95", "p99", "chunk p50", "chunk p99", "failed", "realtime"))
+    for detectorname, r in results.items():
+        if r["chunk_time_median"] is None:
+            print("{:30s} no annotated recordings".format(detectorname))
+            continue
+        if r["beats"] == 0:
+            print("{:30s} no matched beats".format(detectorname))
+            continue
+        print("{:30s} {:8.1f}% {:8.1f} {:8.1f} {:8.1f} {:10.2f} {:10.2f} {:8d} {:>9s}".format(
+            detectorname, r["detected"] * 100, r["latency_median"] * 1E3, r["latency_p95"] * 1E3, r["latency_p99"] * 1E3,
+            r["chunk_time_median"] * 1E3, r["chunk_time_p99"] * 1E3, r["failed_chunks"],
+            "yes" if r["realtime"] else "NO"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("detector", nargs="*",
+                        help="index or name of a detector or module:function (default: all)")
+    parser.add_argument("--param", nargs="+",
+                        help="parameter grid of the detectors: parameter=value1,value2,...")
+    parser.add_argument("--dataset", default="gudb",
+                        help="gudb, gudb:<path>, wfdb:<path>[:<annotator>] or synthetic[:<subjects>]")
+    parser.add_argument("--chunk", type=float, default=chunk_duration, help="chunk duration in s")
+    parser.add_argument("--window", type=float, default=window_duration, help="detector window in s")
+    parser.add_argument("--max-latency", type=float, default=max_latency, help="beats found later are not reported (s)")
+    parser.add_argument("--subjects", type=int, nargs="+", help="subject numbers (default: all)")
+    parser.add_argument("--experiments", nargs="+", help="experiments (default: all)")
+    args = parser.parse_args()
+
+    chunk_duration = args.chunk
+    window_duration = args.window
+    max_latency = args.max_latency
+    benchmark.use_dataset(datasets.from_name(args.dataset))
+    detectors = Detectors(benchmark.fs) # Initialise detectors for the sampling rate of the dataset
+
+    # every combination of the parameters is evaluated as a detector of its own
+    detector_registry.register_detectors(detectors)
+    detector_list = detector_registry.detector_list(args.detector, detector_registry.parse_grid(args.param))
+    detector_registry.save_index(detector_list, benchmark.resultsdir)
+
+    subjects = args.subjects if args.subjects is not None else benchmark.dataset.subjects
+    experiments = args.experiments if args.experiments is not None else benchmark.dataset.experiments
+
+    results = {}
+    for detector in detector_list:
+        latency, chunk_times, errors, n_anno = replay_detector(detector, benchmark.dataset.leads, experiments, subjects)
+        results[detector[1].__name__] = summary(latency, chunk_times, errors, n_anno)
+        with open(benchmark.resultsdir+"/realtime_"+detector[1].__name__+".json","w") as f:
+            f.write(json.dumps(results[detector[1].__name__],indent="\t"))
+
+    print_summary(results)
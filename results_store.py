@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Columnar results store
+======================
+All results of one kind (jmx, sens or the detector cost) are stored in a
+single .npz file (results/jmx.npz, results/sens.npz, results/cost.npz) with one row per
+detector/lead/experiment/subject and one column per value, so that the
+stats and plotting scripts read everything with one load instead of
+parsing one json file per detector and condition.
+
+    store = results_store.load("jmx")
+    store.query("jmx", detector="swt_detector", lead="einthoven_ii", experiment="sitting")
+
+Values which are False in the json results (no beats) are stored as NaN.
+The sensitivity curves (sens_curve) have one value per tolerance so
+their columns are 2D arrays with one row per recording.
+Existing json results can be converted with:
+python results_store.py
+"""
+
+import os
+import json
+import numpy as np
+
+resultsdir = "results"
+
+# value columns of the different result types
+columns = {
+    "jmx" : ["jitter", "TP", "TN", "FP", "FN", "accuracy", "jmx"],
+    "sens" : ["sensitivity", "TP", "FP", "FN"],
+    "cost" : ["wall_time", "cpu_time", "samples_per_sec", "peak_memory"],
+    # one value per tolerance of sensitivity_analysis.curve_tolerances
+    "sens_curve" : ["sensitivity", "ppv"],
+}
+
+key_columns = ["detector", "lead", "experiment", "subject"]
+
+
+def store_file(prefix):
+    return resultsdir+"/"+prefix+".npz"
+
+
+def to_values(prefix, result):
+    """
+    Converts a jmx, cost or curve dict or a sensitivity tuple to a list
+    of floats (or of float arrays for the curves).
+    """
+    if isinstance(result, dict):
+        values = [result[c] for c in columns[prefix]]
+    else:
+        values = list(result)
+    return [np.array([np.nan if x is None else x for x in v], dtype=float) if isinstance(v, list)
+            else np.nan if v is None or v is False else float(v) for v in values]
+
+
+def make_table(prefix, rows):
+    """rows: list of (detector, lead, experiment, subject, result)"""
+    table = {}
+    table["detector"] = np.array([r[0] for r in rows], dtype=str)
+    table["lead"] = np.array([r[1] for r in rows], dtype=str)
+    table["experiment"] = np.array([r[2] for r in rows], dtype=str)
+    table["subject"] = np.array([r[3] for r in rows], dtype=int)
+    values = [to_values(prefix, r[4]) for r in rows]
+    for i, c in enumerate(columns[prefix]):
+        table[c] = np.array([v[i] for v in values], dtype=float)
+    return table
+
+
+def update(prefix, rows):
+    """
+    Writes the rows into the store of prefix. All rows of the detectors
+    in rows are replaced and the results of other detectors are kept.
+    """
+    if len(rows) == 0:
+        return
+    table = make_table(prefix, rows)
+    filename = store_file(prefix)
+    if os.path.exists(filename):
+        with np.load(filename) as old:
+            keep = ~np.isin(old["detector"], table["detector"])
+            for c in key_columns + columns[prefix]:
+                table[c] = np.concatenate((old[c][keep], table[c]))
+    order = np.lexsort((table["subject"], table["experiment"], table["lead"], table["detector"]))
+    tmp = filename[:-4] + ".%d.npz" % os.getpid()
+    np.savez(tmp, **{c : table[c][order] for c in key_columns + columns[prefix]})
+    os.replace(tmp, filename)
+
+
+def subject_key(subjects, subject):
+    """Subject column of a subject: its number or the position in subjects for named records (WFDB)."""
+    if not isinstance(subject, int):
+        return list(subjects).index(subject)
+    return subject
+
+
+def rows_from_json(prefix, detectornames, subjects):
+    """
+    Rows from the results/<prefix>_<detector>.json files. The json files
+    don't contain the subject numbers so the position in the list is
+    mapped to the subject of the dataset with the same position.
+    """
+    rows = []
+    for detectorname in detectornames:
+        with open(resultsdir+"/"+prefix+"_"+detectorname+".json","r") as f:
+            data = json.loads(f.read())
+        for lead, experiments in data.items():
+            for experiment, results in experiments.items():
+                for i, result in enumerate(results):
+                    if result is None: # failed task
+                        continue
+                    rows.append((detectorname, lead, experiment, subject_key(subjects, subjects[i]), result))
+    return rows
+
+
+class ResultsStore:
+    """The loaded columns and an index (detector, lead, experiment) -> rows."""
+
+    def __init__(self, table):
+        self.table = table
+        self.index = {}
+        n = len(table["detector"])
+        if n == 0:
+            return
+        # rows are sorted by detector, lead, experiment, subject
+        key = np.char.add(np.char.add(np.char.add(table["detector"], "\0"),
+                                      np.char.add(table["lead"], "\0")), table["experiment"])
+        start = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        end = np.r_[start[1:], n]
+        for s, e in zip(start, end):
+            self.index[(table["detector"][s], table["lead"][s], table["experiment"][s])] = slice(s, e)
+
+    def query(self, column, detector = None, lead = None, experiment = None, subject = None):
+        """Returns the column as a numpy array for the rows matching all given keys."""
+        if detector is not None and lead is not None and experiment is not None:
+            rows = self.index.get((detector, lead, experiment), slice(0, 0))
+            values = self.table[column][rows]
+            if subject is not None:
+                values = values[self.table["subject"][rows] == subject]
+            return values
+        mask = np.ones(len(self.table["detector"]), dtype=bool)
+        for c, v in zip(key_columns, (detector, lead, experiment, subject)):
+            if v is not None:
+                mask &= self.table[c] == v
+        return self.table[column][mask]
+
+
+def load(prefix, detectornames = None, subjects = None):
+    """
+    Loads the store of prefix. If there is none it's built from the
+    json files of the detectors in detectornames with the subjects of
+    their dataset.
+    """
+    filename = store_file(prefix)
+    if os.path.exists(filename):
+        with np.load(filename) as f:
+            return ResultsStore({c : f[c] for c in f.files})
+    rows = rows_from_json(prefix, detectornames, subjects)
+    table = make_table(prefix, rows)
+    order = np.lexsort((table["subject"], table["experiment"], table["lead"], table["detector"]))
+    return ResultsStore({c : v[order] for c, v in table.items()})
+
+
+if __name__ == "__main__":
+    from ecgdetectors import Detectors
+    import datasets
+    det_names = [i[1].__name__ for i in Detectors().get_detector_list()]
+    for prefix in columns:
+        names = [d for d in det_names if os.path.exists(resultsdir+"/"+prefix+"_"+d+".json")]
+        if names:
+            update(prefix, rows_from_json(prefix, names, datasets.GUDB.subjects))
+            print("Written:", store_file(prefix))
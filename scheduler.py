@@ -0,0 +1,229 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Process pool scheduler
+======================
+Splits a benchmark run into (detector, lead, experiment, subject) tasks
+and runs them on a bounded pool of worker processes. The tasks are
+ordered longest job first based on the runtimes recorded in previous
+runs (<resultsdir>/runtimes.json) so that slow detectors such as the SWT or
+matched filter don't end up as stragglers at the end of the run.
+Completed and failed tasks are reported as they finish and committed to
+the checkpoint so that a restarted run only does the remaining tasks.
+The results are gathered into the usual results/<prefix>_<detector>.json
+files.
+The recordings are loaded once by the parent process into a memory
+mapped arena (shared_arena.py) which all workers read without copies.
+The tasks are then started recording by recording (in the order of
+their longest task) and longest job first only within each recording,
+so slow detectors of the last recordings can still be stragglers.
+With shared=False the order is longest job first over all tasks.
+"""
+
+import os
+import time
+import json
+import traceback
+from multiprocessing import Pool
+
+import benchmark
+import aggregate
+import tracing
+import shared_arena
+import prefetch
+from checkpoint import Checkpoint
+
+
+def runtimes_file():
+    """Mean runtime per task of every detector from previous runs."""
+    return benchmark.resultsdir+"/runtimes.json"
+
+
+def load_runtimes():
+    try:
+        with open(runtimes_file(),"r") as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_runtimes(runtimes):
+    with open(runtimes_file(),"w") as f:
+        f.write(json.dumps(runtimes,indent="\t"))
+
+
+def make_tasks(detector_list, leads, experiments, subjects):
+    """All (detector, lead, experiment, subject) combinations."""
+    return [(detector, record_lead, experiment, subject_number)
+            for detector in detector_list
+            for record_lead in leads
+            for experiment in experiments
+            for subject_number in subjects]
+
+
+def order_tasks(tasks, runtimes):
+    """
+    Longest job first. Detectors without a recorded runtime are
+    started first as their runtime is unknown.
+    """
+    return sorted(tasks, key = lambda task: -runtimes.get(task[0][1].__name__, float("inf")))
+
+
+def init_worker(dataset, trace = (False, None)):
+    """Worker: the dataset (or arena) and the tracing settings of the parent process."""
+    benchmark.dataset = dataset
+    tracing.configure(trace)
+
+
+def run_task(args):
+    """
+    Worker: evaluates one task and returns (task, results, runtime, error, trace events).
+    Exceptions are caught so that a failing task doesn't stop the run.
+    error: the recording of the task couldn't be loaded into the arena.
+    """
+    task, scores, recordings, error = args
+    if error is not None:
+        return task, None, 0.0, error, tracing.collect()
+    if recordings:
+        # the arena descriptors of the recording of this task
+        benchmark.dataset.add(recordings)
+    detector, record_lead, experiment, subject_number = task
+    t0 = time.perf_counter()
+    try:
+        with tracing.task("{}_{}_{}_{}".format(detector[1].__name__, record_lead, experiment, subject_number)):
+            r = benchmark.evaluate_task(*task, scores)
+        error = None
+    except Exception:
+        r = None
+        error = traceback.format_exc()
+    return task, r, time.perf_counter() - t0, error, tracing.collect()
+
+
+def arena_tasks(arena, tasks, scores):
+    """
+    Generator of the arguments of run_task. The recordings are loaded
+    (in the background) and written into the arena one after the other
+    and their tasks are handed to the pool as soon as they are written,
+    so the workers run while the next recordings are still loaded.
+    The recordings come in the order of their first task and keep the
+    order of their tasks (longest job first within the recording).
+    If a recording can't be loaded its tasks are handed on with the
+    error, so they fail and the rest of the run goes on.
+    """
+    groups = {} # (subject, experiment) -> tasks in their order
+    for task in tasks:
+        detector, record_lead, experiment, subject_number = task
+        groups.setdefault((subject_number, experiment), []).append(task)
+
+    def load(group):
+        subject_number, experiment = group
+        record_leads = list(dict.fromkeys(task[1] for task in groups[group]))
+        # the dataset keeps the recording loaded for all its leads
+        try:
+            return {record_lead : benchmark.dataset.load(subject_number, experiment, record_lead)
+                    for record_lead in record_leads}, None
+        except Exception:
+            return None, traceback.format_exc()
+
+    for (subject_number, experiment), (loaded, error) in prefetch.prefetch(load, groups):
+        if error is not None:
+            for task in groups[(subject_number, experiment)]:
+                yield task, scores, None, error
+            continue
+        recordings = {}
+        with tracing.stage("arena_write"):
+            for record_lead, recording in loaded.items():
+                recordings.update(arena.add((subject_number, experiment, record_lead), recording))
+            arena.flush()
+        for task in groups[(subject_number, experiment)]:
+            yield task, scores, recordings, None
+
+
+def run(detector_list, scores, leads = None, experiments = None, subjects = None,
+        jobs = None, shared = True):
+    """
+    Runs all tasks on a pool of 'jobs' processes (default: number of cores)
+    and saves the results/<prefix>_<detector>.json files.
+    leads, experiments and subjects default to all of benchmark.dataset.
+    shared: the workers read the recordings from a shared arena instead
+    of loading them themselves. The arena is filled while the workers
+    run, recording by recording.
+    Returns the list of failed tasks.
+    """
+    if jobs is None:
+        jobs = os.cpu_count()
+    leads, experiments, subjects = benchmark.selection(leads, experiments, subjects)
+
+    detectornames = [detector[1].__name__ for detector in detector_list]
+    runtimes = load_runtimes()
+    ckpt = Checkpoint(benchmark.checkpoint_file(scores, detectornames))
+    tasks = [task for task in make_tasks(detector_list, leads, experiments, subjects)
+             if (task[0][1].__name__,) + task[1:] not in ckpt]
+    tasks = order_tasks(tasks, runtimes)
+    if len(ckpt) > 0:
+        print("Resuming: {} tasks already done, {} to go".format(len(ckpt), len(tasks)))
+
+    failed = []
+    elapsed = {}
+
+    # running statistics per detector/lead/experiment, updated with every result
+    averages = aggregate.Aggregator(benchmark.summary_names)
+    for (detectorname, record_lead, experiment, subject_number), r in ckpt.done.items():
+        if r is not None:
+            averages.update((detectorname, record_lead, experiment), benchmark.summary_values(r))
+
+    dataset = benchmark.dataset
+    arguments = [(task, scores, None, None) for task in tasks]
+    if shared:
+        # every recording needed by the remaining tasks is loaded once
+        arena = shared_arena.ArenaWriter(benchmark.dataset)
+        dataset = arena.shared
+        arguments = arena_tasks(arena, tasks, scores)
+
+    beats = benchmark.beat_writer(scores)
+    try:
+        with Pool(processes = jobs, initializer = init_worker, initargs = (dataset, tracing.settings())) as pool:
+            for n, (task, r, runtime, error, events) in enumerate(
+                    pool.imap_unordered(run_task, arguments), 1):
+                tracing.add(events)
+                detector, record_lead, experiment, subject_number = task
+                detectorname = detector[1].__name__
+                if error is None:
+                    benchmark.store_beats(beats, (detectorname, record_lead, experiment, subject_number), r)
+                    ckpt.append((detectorname, record_lead, experiment, subject_number), r)
+                    if r is not None:
+                        averages.update((detectorname, record_lead, experiment), benchmark.summary_values(r))
+                    elapsed.setdefault(detectorname, []).append(runtime)
+                    status = "done"
+                else:
+                    failed.append(task)
+                    status = "FAILED\n" + error
+                print("[{}/{}] {}, {}, {}, subject {}: {} ({:1.2f} sec)".format(
+                    n, len(tasks), detectorname, record_lead, experiment, subject_number, status, runtime))
+    finally:
+        if shared:
+            arena.close()
+            shared_arena.remove(dataset)
+        if beats is not None:
+            beats.close()
+
+    benchmark.save(ckpt.done, detectornames, scores, leads, experiments, subjects)
+    if failed:
+        # keep the checkpoint so that only the failed tasks are rerun
+        ckpt.close()
+    else:
+        ckpt.remove()
+
+    for detectorname, t in elapsed.items():
+        runtimes[detectorname] = sum(t) / len(t)
+    save_runtimes(runtimes)
+
+    for name in benchmark.summary_names:
+        averages.print_summary(name)
+
+    if failed:
+        print("{} of {} tasks failed:".format(len(failed), len(tasks)))
+        for detector, record_lead, experiment, subject_number in failed:
+            print("  {}, {}, {}, subject {}".format(detector[1].__name__, record_lead, experiment, subject_number))
+
+    return failed
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the scoring functions
+==================================
+Measures how the scoring functions scale with the number of beats on
+synthetic annotations/detections with a controllable jitter, miss rate
+and extra detection rate. For every function and size the throughput
+(beats/sec, best of several repeats) and the peak memory (tracemalloc)
+are recorded.
+
+python scoring_benchmark.py --save   # stores the baseline
+python scoring_benchmark.py          # compares against the baseline
+
+Measurements which are slower or use more memory than the baseline by
+more than the threshold factor are flagged as regressions and the
+script then exits with 1.
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+import numpy as np
+
+import util
+import jmx_analysis
+import jmx_streaming
+import sensitivity_analysis
+import synthetic
+
+fs = 250
+
+baselinefile = "results/scoring_baseline.json"
+
+default_sizes = [100, 1000, 10000, 100000, 1000000]
+
+
+def streaming(det, anno, nSamples):
+    ev = jmx_streaming.StreamingEvaluator(fs)
+    chunk = 10000
+    for i in range(0, max(len(det), len(anno)), chunk):
+        ev.update(det[i:i+chunk], anno[i:i+chunk])
+    return ev.finalize(nSamples)
+
+
+def batch(det, anno, nSamples):
+    # the beats split into 2 min recordings
+    n_rec = max(int(nSamples / (120 * fs)), 1)
+    bounds = np.linspace(0, nSamples, n_rec + 1)
+    det_offsets = np.searchsorted(det, bounds)
+    anno_offsets = np.searchsorted(anno, bounds)
+    return jmx_analysis.evaluate_batch(det, det_offsets, anno, anno_offsets, fs, np.diff(bounds))
+
+
+# name -> function(detections, annotations, nSamples)
+functions = {
+    "calcMedianDelay" : lambda det, anno, nSamples: util.calcMedianDelay(det, anno),
+    "nearest_diff" : lambda det, anno, nSamples: jmx_analysis.nearest_diff(anno, det),
+    "jmx_analysis.evaluate" : lambda det, anno, nSamples: jmx_analysis.evaluate(det, anno, fs, nSamples),
+    "jmx_analysis.evaluate_batch" : batch,
+    "jmx_streaming" : streaming,
+    "sensitivity_analysis.evaluate" : lambda det, anno, nSamples: sensitivity_analysis.evaluate(det, anno, fs/10),
+}
+
+
+def measure(func, det, anno, nSamples, repeat):
+    """Returns the best runtime in s and the peak memory in bytes."""
+    with contextlib.redirect_stdout(io.StringIO()): # the evaluate functions print their results
+        t = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            func(det, anno, nSamples)
+            t.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        func(det, anno, nSamples)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(t), peak
+
+
+def run(sizes, jitter, miss_rate, extra_rate, repeat):
+    results = {}
+    for n in sizes:
+        det, anno, nSamples = synthetic.beats(n, fs, jitter, miss_rate, extra_rate, seed = n)
+        for name, func in functions.items():
+            t, peak = measure(func, det, anno, nSamples, repeat)
+            results["{} {}".format(name, n)] = {"time" : t, "beats_per_sec" : n / t, "peak_memory" : peak}
+            print("{:32s} {:8d} beats: {:10.4f} sec {:14.0f} beats/sec {:10.2f} MB".format(
+                name, n, t, n / t, peak / 1E6))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the list of regressions against the baseline."""
+    regressions = []
+    for k, r in results.items():
+        if k not in baseline:
+            continue
+        b = baseline[k]
+        # differences below a millisecond are timer noise
+        if r["time"] > b["time"] * threshold and r["time"] - b["time"] > 1E-3:
+            regressions.append("{}: {:1.4f} sec instead of {:1.4f} sec".format(k, r["time"], b["time"]))
+        if r["peak_memory"] > b["peak_memory"] * threshold:
+            regressions.append("{}: {:1.2f} MB instead of {:1.2f} MB".format(k, r["peak_memory"] / 1E6, b["peak_memory"] / 1E6))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="numbers of beats")
+    parser.add_argument("--jitter", type=float, default=4E-3, help="detection jitter in s")
+    parser.add_argument("--miss", type=float, default=0.01, help="share of missed beats")
+    parser.add_argument("--extra", type=float, default=0.01, help="extra detections per beat")
+    parser.add_argument("--repeat", type=int, default=3, help="repeats per measurement (best is used)")
+    parser.add_argument("--threshold", type=float, default=1.5, help="factor flagged as regression")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.jitter, args.miss, args.extra, args.repeat)
+
+    if args.save:
+        with open(baselinefile,"w") as f:
+            f.write(json.dumps(results,indent="\t"))
+        print("Baseline saved:", baselinefile)
+    else:
+        try:
+            with open(baselinefile,"r") as f:
+                baseline = json.loads(f.read())
+        except OSError:
+            print("No baseline, run with --save first")
+            sys.exit(0)
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print("REGRESSION:", r)
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
@@ -4,24 +4,27 @@ Trad sensitivity analysis with true positives, false positives, and false negati
 """
 import numpy as np
 import util
+import tracing
+
+# tolerances of the sensitivity curve in s (0 to 100ms: every sample at 250Hz)
+curve_tolerances = np.arange(0, 26) * 4E-3
 
 """
 The central function evaluating true positive, false positive and false negative.
 """
 def evaluate(detected_peaks, annotation, tol):
 
-    delay = util.calcMedianDelay(detected_peaks, annotation)
+    with tracing.stage("calcMedianDelay"):
+        delay = util.calcMedianDelay(detected_peaks, annotation)
 
     detected_peaks = np.unique(detected_peaks)
     annotation = np.unique(annotation)
     
-    tp = 0
-
-    for anno_value in annotation:
-        test_range = np.arange(anno_value-tol+delay, anno_value+1+tol+delay)
-        in1d = np.in1d(test_range, detected_peaks)
-        if np.any(in1d):
-            tp = tp + 1
+    # an annotation is a true positive if there is at least one detection
+    # within [anno-tol+delay, anno+tol+delay]
+    first = np.searchsorted(detected_peaks, annotation-tol+delay, side='left')
+    last = np.searchsorted(detected_peaks, annotation+tol+delay, side='right')
+    tp = int(np.count_nonzero(last > first))
 
     fp = len(detected_peaks)-tp
     fn = len(annotation)-tp
@@ -32,3 +35,43 @@ def evaluate(detected_peaks, annotation, tol):
         sensitivity = tp/(tp+fn)*100.0
 
     return (sensitivity, tp, fp, fn)
+
+
+"""
+Distance of every annotation to the nearest delay corrected detection in
+samples. An annotation is a true positive for all tolerances which are
+larger or equal than its distance (same windows as evaluate).
+Returns the distances and the numbers of detections and annotations.
+"""
+def distances(detected_peaks, annotation):
+
+    delay = util.calcMedianDelay(detected_peaks, annotation)
+
+    detected_peaks = np.unique(detected_peaks)
+    annotation = np.unique(annotation)
+
+    d = util.nearestDistance(annotation + delay, detected_peaks, anno_sorted=True)
+    return d, len(detected_peaks), len(annotation)
+
+
+"""
+Sensitivity and positive predictive value (in %) for all tolerances
+(in s) from one distance computation: the number of true positives for
+every tolerance is read from the cumulative histogram of the distances.
+"""
+def curve(detected_peaks, annotation, fs, tolerances = curve_tolerances):
+
+    d, n_det, n_anno = distances(detected_peaks, annotation)
+
+    tol = np.floor(np.asarray(tolerances) * fs + 1E-9).astype(np.int64)
+    hist = np.bincount(np.minimum(d, tol.max() + 1), minlength = tol.max() + 2)
+    tp = np.cumsum(hist)[tol]
+
+    fp = n_det - tp
+    fn = n_anno - tp
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sensitivity = np.where(tp + fn > 0, tp/(tp+fn)*100.0, np.nan)
+        ppv = np.where(tp + fp > 0, tp/(tp+fp)*100.0, np.nan)
+
+    return sensitivity, ppv, tp, fp, fn
@@ -3,7 +3,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 import scipy.stats as stats
 from ecgdetectors import Detectors
-import json
+import results_store
+import datasets
+import sensitivity_analysis
 
 experiment_names = ['sitting','maths','walking','hand_bike','jogging']
 
@@ -20,12 +22,18 @@ alpha = 0.05
 
 min_sens = 90 # %
 
+# all results in one columnar store (built from the json files if needed)
+store = results_store.load("sens", det_names, datasets.GUDB.subjects)
+
+# sensitivity and PPV over all tolerances per recording
+try:
+    curve_store = results_store.load("sens_curve", det_names, datasets.GUDB.subjects)
+except OSError:
+    curve_store = None # results from a run without the curves
+
 def get_sensitivities(detector_name, leads, experiment):
-    f = open(resultsdir+"/sens_"+detector_name+".json","r")
-    js = f.read()
-    data = json.loads(js)
-    s = [i[0] for i in data[leads][experiment]]
-    return np.array(s)
+    s = store.query("sensitivity", detector_name, leads, experiment)
+    return np.nan_to_num(s) # no beats counts as zero sensitivity
 
 
 def get_result(det, leads, experiment):
@@ -33,9 +41,10 @@ def get_result(det, leads, experiment):
     m = []
     s = []
     for det in det_names:
-        print(det,experiment,get_sensitivities(det, leads, experiment))
-        m.append(np.mean(get_sensitivities(det, leads, experiment)))
-        s.append(np.std(get_sensitivities(det, leads, experiment)))
+        r = get_sensitivities(det, leads, experiment)
+        print(det,experiment,r)
+        m.append(np.mean(r))
+        s.append(np.std(r))
 
     return np.array(m),np.array(s)
 
@@ -86,6 +95,27 @@ def double_plot(data1, std1, data2, std2, y_label, legend1, legend2, title=None)
 
     return rects1, rects2
 
+def curve_plot(leads, experiment, title=None):
+    """Mean sensitivity and PPV of every detector against the tolerance."""
+    fig, (ax1, ax2) = plt.subplots(1, 2)
+    fig.set_size_inches(12, 5)
+    tolerance = sensitivity_analysis.curve_tolerances * 1E3
+    for det, name in zip(det_names, plot_names):
+        ax1.plot(tolerance, np.nanmean(curve_store.query("sensitivity", det, leads, experiment), axis=0), label=name)
+        ax2.plot(tolerance, np.nanmean(curve_store.query("ppv", det, leads, experiment), axis=0), label=name)
+    ax1.set_ylabel('Sensitivity (%)')
+    ax2.set_ylabel('PPV (%)')
+    for ax in (ax1, ax2):
+        ax.set_xlabel('Tolerance (ms)')
+        ax.set_ylim([0,105])
+    ax2.legend()
+
+    if title!=None:
+        fig.suptitle(title)
+
+    plt.tight_layout()
+
+
 def print_result(title,data,std,legend):
     print("Sensitivities:",title)
     for i in zip(legend,data,std):
@@ -116,6 +146,13 @@ double_plot(cs_sitting_avg, cs_sitting_std,
             'Sensitivity (%)', 'Sitting', 'Jogging', 'Chest strap')
 
 
+if curve_store is not None:
+    curve_plot(einth, 'sitting', 'Einthoven, sitting')
+    curve_plot(einth, 'jogging', 'Einthoven, jogging')
+    curve_plot(cs, 'sitting', 'Chest strap, sitting')
+    curve_plot(cs, 'jogging', 'Chest strap, jogging')
+
+
 calc_stats(einth,"sitting")
 calc_stats(einth,"jogging")
 
@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Sequential screening of detectors
+=================================
+jmx_stats_plots.py tests the JMX of every detector against minjmx only
+after all subjects have been evaluated. This script evaluates the
+subjects one after the other for all detectors together and updates
+the statistics of every detector/lead/experiment after each subject.
+A detector is no longer evaluated for a lead/experiment as soon as its
+verdict is settled at the level alpha:
+
+threshold (default): one sided t-tests of the mean JMX against minjmx.
+    "pass" if it's significantly above minjmx, "fail" if it's
+    significantly below. Detectors which are still open after the last
+    subject are "undecided" (at alpha/looks, like the other verdicts).
+--race: Welch t-test of every detector against the one with the
+    highest mean JMX. Detectors which are significantly worse are
+    eliminated and ranked behind the remaining ones.
+
+A look is done after every subject starting with min_subjects. As the
+test is repeated, alpha is divided by the number of possible looks
+(Bonferroni) which keeps the error rate of the early verdicts at alpha.
+
+python sequential_screening.py [--race] [--alpha 0.05] [--minjmx 90]
+
+The verdicts are stored in results/screening_jmx.json (race_jmx.json).
+"""
+
+import math
+import json
+import argparse
+import numpy as np
+import scipy.stats as stats
+from ecgdetectors import Detectors
+
+import benchmark
+import datasets
+import aggregate
+import prefetch
+import jmx_analysis
+
+alpha = 0.05 # as in jmx_stats_plots.py
+minjmx = 90 # %
+min_subjects = 5 # subjects before the first look
+
+
+def t_test(s, minjmx):
+    """One sided p values (greater, less) of the mean of the RunningStats s against minjmx."""
+    se = math.sqrt(s.m2 / (s.count - 1) / s.count)
+    if se == 0:
+        return (0.0 if s.mean > minjmx else 1.0), (0.0 if s.mean < minjmx else 1.0)
+    t = (s.mean - minjmx) / se
+    return stats.t.sf(t, s.count - 1), stats.t.cdf(t, s.count - 1)
+
+
+def welch_test(best, s):
+    """One sided p value that the mean of s is below the one of best."""
+    vb = best.m2 / (best.count - 1) / best.count
+    vs = s.m2 / (s.count - 1) / s.count
+    if vb + vs == 0:
+        return 0.0 if s.mean < best.mean else 1.0
+    t = (best.mean - s.mean) / math.sqrt(vb + vs)
+    df = (vb + vs)**2 / (vb**2 / (best.count - 1) + vs**2 / (s.count - 1))
+    return stats.t.sf(t, df)
+
+
+def verdict(detectorname, s, p, result, stopped_early, **kwargs):
+    r = {"detector" : detectorname, "subjects" : s.count,
+         "mean" : s.mean, "std" : s.std() if s.count > 0 else math.nan,
+         "p" : p, "verdict" : result, "stopped_early" : stopped_early}
+    r.update(kwargs)
+    return r
+
+
+def settle_threshold(condition, active, running, results, alpha_look):
+    """Removes the detectors with a pass/fail verdict from active."""
+    for detector in list(active):
+        s = running[detector[1].__name__, condition]
+        if s.count < max(min_subjects, 2):
+            continue
+        p_greater, p_less = t_test(s, minjmx)
+        if p_greater < alpha_look:
+            results.append(verdict(detector[1].__name__, s, p_greater, "pass", True))
+        elif p_less < alpha_look:
+            results.append(verdict(detector[1].__name__, s, p_less, "fail", True))
+        else:
+            continue
+        active.remove(detector)
+
+
+def settle_race(condition, active, running, results, alpha_look):
+    """Removes the detectors which are significantly worse than the best one from active."""
+    if len(active) < 2 or any(running[d[1].__name__, condition].count < max(min_subjects, 2) for d in active):
+        return
+    best = max(running[d[1].__name__, condition].mean for d in active)
+    best = [running[d[1].__name__, condition] for d in active if running[d[1].__name__, condition].mean == best][0]
+    alpha_pair = alpha_look / (len(active) - 1)
+    worse = []
+    for detector in active:
+        s = running[detector[1].__name__, condition]
+        if s is best:
+            continue
+        p = welch_test(best, s)
+        if p < alpha_pair:
+            worse.append((detector, p))
+    # eliminated together: consecutive ranks behind the remaining ones, by their mean (then name)
+    worse.sort(key = lambda w: (-running[w[0][1].__name__, condition].mean, w[0][1].__name__))
+    first_rank = len(active) - len(worse) + 1
+    for rank, (detector, p) in enumerate(worse, first_rank):
+        results.append(verdict(detector[1].__name__, running[detector[1].__name__, condition], p,
+                               "eliminated", True, rank = rank))
+    for detector, p in worse:
+        active.remove(detector)
+
+
+def screen(detector_list, leads = None, experiments = None, subjects = None, race = False):
+    """
+    Evaluates the subjects one by one until the verdicts of all detectors
+    for every lead/experiment are settled.
+    Returns a dict (lead, experiment) -> list of verdicts and the number
+    of evaluated detector runs.
+    """
+    leads, experiments, subjects = benchmark.selection(leads, experiments, subjects)
+    conditions = [(record_lead, experiment) for experiment in experiments for record_lead in leads]
+    running = {(detector[1].__name__, condition) : aggregate.RunningStats(quantiles = ())
+               for detector in detector_list for condition in conditions}
+    active = {condition : list(detector_list) for condition in conditions}
+    results = {condition : [] for condition in conditions}
+    looks = max(len(subjects) - min_subjects + 1, 1)
+    settle = settle_race if race else settle_threshold
+
+    def recordings():
+        # only the recordings which are still needed (checked when they are queued)
+        for subject_number in subjects:
+            for experiment in experiments:
+                if any(active[(record_lead, experiment)] for record_lead in leads):
+                    yield subject_number, experiment
+
+    def load(recording):
+        return benchmark.load_recording(recording[0], recording[1], leads)
+
+    evaluated = 0
+    for (subject_number, experiment), loaded in prefetch.prefetch(load, recordings()):
+        for record_lead in leads:
+            condition = (record_lead, experiment)
+            if loaded[record_lead] is None or not active[condition]:
+                continue
+            data, data_anno, fs, metadata = loaded[record_lead]
+            for detector in active[condition]:
+                print("Analysing subject {}, {}, {}, {}".format(subject_number, experiment, record_lead, detector[0]))
+                r = benchmark.detect_and_score(detector, data, data_anno, {"jmx" : benchmark.score_jmx}, fs)
+                evaluated += 1
+                v = r["jmx"][jmx_analysis.key_jmx]
+                if v and not np.isnan(v): # recordings without a score
+                    running[detector[1].__name__, condition].add(v * 100)
+            settle(condition, active[condition], running, results[condition], alpha / looks)
+
+    # all subjects done: the remaining detectors
+    for condition in conditions:
+        remaining = sorted(active[condition], key = lambda d: -running[d[1].__name__, condition].mean)
+        for rank, detector in enumerate(remaining, 1):
+            s = running[detector[1].__name__, condition]
+            if race:
+                results[condition].append(verdict(detector[1].__name__, s, None, "remaining", False, rank = rank))
+            elif s.count < 2:
+                results[condition].append(verdict(detector[1].__name__, s, None, "fail", False))
+            else:
+                # same level as the looks, so the error rate of all verdicts stays at alpha
+                p_greater, p_less = t_test(s, minjmx)
+                if p_greater < alpha / looks:
+                    results[condition].append(verdict(detector[1].__name__, s, p_greater, "pass", False))
+                elif p_less < alpha / looks:
+                    results[condition].append(verdict(detector[1].__name__, s, p_less, "fail", False))
+                else:
+                    results[condition].append(verdict(detector[1].__name__, s, p_greater, "undecided", False))
+        if race:
+            results[condition].sort(key = lambda r: r["rank"])
+
+    return results, evaluated
+
+
+def print_results(results, evaluated, total):
+    for (record_lead, experiment), verdicts in results.items():
+        print("{}, {}:".format(record_lead, experiment))
+        print("  {:30s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s}".format("detector", "subjects", "mean", "std", "p", "verdict"))
+        for r in verdicts:
+            label = r["verdict"] if "rank" not in r else "{} ({})".format(r["rank"], r["verdict"])
+            p = "---" if r["p"] is None else "{:1.4f}".format(r["p"])
+            print("  {:30s} {:8d} {:8.2f} {:8.2f} {:>10s} {:>10s}{}".format(
+                r["detector"], r["subjects"], r["mean"], r["std"], p, label, " *" if r["stopped_early"] else ""))
+    print("* stopped early")
+    print("Evaluated {} of {} detector runs ({:1.0f}%)".format(evaluated, total, evaluated / total * 100))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default="gudb",
+                        help="gudb, gudb:<path>, wfdb:<path>[:<annotator>] or synthetic[:<subjects>]")
+    parser.add_argument("--race", action="store_true", help="rank the detectors instead of testing against minjmx")
+    parser.add_argument("--alpha", type=float, default=alpha, help="significance level")
+    parser.add_argument("--minjmx", type=float, default=minjmx, help="JMX threshold in %%")
+    parser.add_argument("--min-subjects", type=int, default=min_subjects, help="subjects before the first look")
+    parser.add_argument("--leads", nargs="+", help="leads (default: all)")
+    parser.add_argument("--experiments", nargs="+", help="experiments (default: all)")
+    args = parser.parse_args()
+
+    alpha = args.alpha
+    minjmx = args.minjmx
+    min_subjects = args.min_subjects
+    benchmark.use_dataset(datasets.from_name(args.dataset))
+    detectors = Detectors(benchmark.fs) # Initialise detectors for the sampling rate of the dataset
+
+    leads, experiments, subjects = benchmark.selection(args.leads, args.experiments, None)
+    results, evaluated = screen(detectors.detector_list, leads, experiments, subjects, args.race)
+    print_results(results, evaluated, len(detectors.detector_list) * len(leads) * len(experiments) * len(subjects))
+
+    filename = "race_jmx.json" if args.race else "screening_jmx.json"
+    with open(benchmark.resultsdir+"/"+filename,"w") as f:
+        f.write(json.dumps({"{}_{}".format(*condition) : verdicts for condition, verdicts in results.items()},
+                           indent="\t"))
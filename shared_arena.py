@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Memory mapped arena of recordings for the worker processes
+==========================================================
+The parent process loads every recording (the lead arrays after any
+filtering and the annotations) once and writes them into a single
+arena file. The workers only get the descriptors (offset, length and
+dtype of every array) and build read-only numpy views on the memory
+mapped file. All processes share the same pages of the page cache so
+the memory stays flat when the number of workers goes up.
+
+    shared = shared_arena.create(dataset, [(subject, experiment, lead), ...])
+    shared.load(subject, experiment, lead) # like dataset.load
+    shared_arena.remove(shared)
+
+The arena can also be filled while the workers are already running
+(ArenaWriter): the descriptors of every new recording are sent with
+its tasks (SharedDataset.add) and the workers map the file again when
+it has grown.
+
+The arena is created in the temp directory (TMPDIR). The recordings
+are loaded by the prefetch threads while the previous ones are written.
+"""
+
+import os
+import tempfile
+import numpy as np
+
+import prefetch
+
+alignment = 64 # bytes, start of every array in the arena
+
+
+class SharedDataset:
+    """
+    Dataset provider which reads the recordings from an arena.
+    Only the descriptors are pickled when it's sent to a worker.
+    """
+
+    def __init__(self, dataset, filename, recordings):
+        self.name = dataset.name
+        self.fs = dataset.fs
+        self.subjects = dataset.subjects
+        self.experiments = dataset.experiments
+        self.leads = dataset.leads
+        self.filename = filename
+        # (subject, experiment, lead) -> (signal descriptor, annotations descriptor, fs, metadata)
+        self.recordings = recordings
+        self.buffer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["buffer"] = None # mapped again in the worker
+        return state
+
+    def view(self, descriptor):
+        offset, count, dtype = descriptor
+        end = offset + count * np.dtype(dtype).itemsize
+        if self.buffer is None or len(self.buffer) < end:
+            # (re)mapped: the arena may have grown since it was mapped
+            self.buffer = np.memmap(self.filename, dtype=np.uint8, mode="r")
+        return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset)
+
+    def add(self, recordings):
+        """Adds the descriptors of recordings which were written after the arena was sent."""
+        self.recordings.update(recordings)
+
+    def load(self, subject_number, experiment, record_lead):
+        r = self.recordings.get((subject_number, experiment, record_lead))
+        if r is None: # no annotations (reported when the arena was created)
+            return None
+        signal, anno, fs, metadata = r
+        return self.view(signal), self.view(anno), fs, metadata
+
+
+class ArenaWriter:
+    """Writes recordings into a new arena; shared is its SharedDataset."""
+
+    def __init__(self, dataset, directory = None):
+        fd, filename = tempfile.mkstemp(prefix="jmx_arena_", suffix=".bin", dir=directory)
+        self.f = os.fdopen(fd, "wb")
+        self.offset = 0
+        self.shared = SharedDataset(dataset, filename, {})
+
+    def write(self, a):
+        a = np.ascontiguousarray(a)
+        pad = -self.offset % alignment
+        self.f.write(b"\0" * pad)
+        self.offset += pad
+        descriptor = (self.offset, a.size, a.dtype.str)
+        self.f.write(a.tobytes())
+        self.offset += a.nbytes
+        return descriptor
+
+    def add(self, key, recording):
+        """
+        Writes the dataset.load() result of the (subject, experiment, lead)
+        key and returns the new descriptors ({} if there are no annotations).
+        """
+        if recording is None: # only proceed if an annotation exists
+            return {}
+        data, data_anno, fs, metadata = recording
+        entry = {key : (self.write(data), self.write(data_anno), fs, metadata)}
+        self.shared.add(entry)
+        return entry
+
+    def flush(self):
+        """Makes the written recordings visible to the workers."""
+        self.f.flush()
+
+    def close(self):
+        if self.offset == 0:
+            self.f.write(b"\0") # an empty file can't be mapped
+        self.f.close()
+
+
+def create(dataset, keys, directory = None):
+    """
+    Loads the (subject, experiment, lead) recordings in keys from the
+    dataset into a new arena and returns its SharedDataset.
+    """
+    arena = ArenaWriter(dataset, directory)
+
+    # the leads of a recording are loaded together, the next recordings in the background
+    groups = {}
+    for subject_number, experiment, record_lead in keys:
+        groups.setdefault((subject_number, experiment), []).append(record_lead)
+
+    def load(group):
+        subject_number, experiment = group
+        return [dataset.load(subject_number, experiment, record_lead) for record_lead in groups[group]]
+
+    for (subject_number, experiment), loaded in prefetch.prefetch(load, groups):
+        for record_lead, recording in zip(groups[(subject_number, experiment)], loaded):
+            arena.add((subject_number, experiment, record_lead), recording)
+
+    arena.close()
+    return arena.shared
+
+
+def remove(shared):
+    """Deletes the arena file. Mapped views stay valid until they are released."""
+    shared.buffer = None
+    try:
+        os.remove(shared.filename)
+    except OSError:
+        pass
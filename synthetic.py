@@ -0,0 +1,69 @@
+"""
+Synthetic test data
+===================
+Generators for annotations and detections with a controllable amount
+of jitter, missed beats and extra detections and for ECG signals
+with known R peak positions.
+"""
+
+import numpy as np
+
+
+def beats(n_beats, fs = 250, jitter = 4E-3, miss_rate = 0.01, extra_rate = 0.01,
+          delay = 20, hr = 70, hrv = 0.05, seed = None):
+    """
+    Generates annotated R peaks and matching detections.
+    n_beats: number of annotated beats
+    fs: sampling rate
+    jitter: standard deviation of the detection jitter in s
+    miss_rate: probability that a beat is not detected
+    extra_rate: number of extra (spurious) detections per beat
+    delay: constant detector delay in samples
+    hr: mean heart rate in beats per minute
+    hrv: relative standard deviation of the RR intervals
+    returns (detections, annotations, nSamples)
+    """
+    rng = np.random.default_rng(seed)
+    rr = 60 / hr * fs
+    intervals = np.maximum(rng.normal(rr, rr * hrv, n_beats), rr / 3)
+    anno = np.cumsum(intervals).astype(np.int64)
+    nSamples = int(anno[-1] + rr) if n_beats > 0 else 0
+
+    detected = anno[rng.random(n_beats) >= miss_rate]
+    detected = detected + delay + np.round(rng.normal(0, jitter * fs, len(detected))).astype(np.int64)
+    extra = rng.integers(0, max(nSamples, 1), int(round(n_beats * extra_rate)))
+    det = np.unique(np.concatenate((detected, extra)))
+    det = det[(det >= 0) & (det < nSamples)]
+    return det, anno, nSamples
+
+
+# P, Q, R, S and T waves: (amplitude, position in s, width in s)
+pqrst = [(0.15, -0.2, 0.025), (-0.1, -0.03, 0.01), (1.0, 0.0, 0.01), (-0.25, 0.03, 0.01), (0.3, 0.25, 0.05)]
+
+
+def ecg(anno, nSamples, fs = 250, noise = 0.02, baseline = 0.1, amplitude = 1E-3, seed = None):
+    """
+    Generates an ECG with a PQRST complex at every annotated R peak
+    plus baseline wander and white noise.
+    anno: R peak positions in samples
+    nSamples: length of the ECG
+    noise: standard deviation of the noise relative to the R peak
+    baseline: amplitude of the baseline wander relative to the R peak
+    amplitude: amplitude of the R peak (V)
+    """
+    rng = np.random.default_rng(seed)
+    offsets = np.arange(int(-0.35 * fs), int(0.5 * fs)) # template around the R peak
+    t = offsets / fs
+    template = np.zeros(len(t))
+    for a, mu, sigma in pqrst:
+        template += a * np.exp(-0.5 * ((t - mu) / sigma) ** 2)
+
+    x = np.zeros(nSamples)
+    idx = np.asarray(anno, dtype=np.int64)[:, None] + offsets[None, :]
+    valid = (idx >= 0) & (idx < nSamples)
+    np.add.at(x, idx[valid], np.broadcast_to(template, idx.shape)[valid])
+
+    n = np.arange(nSamples) / fs
+    x += baseline * np.sin(2 * np.pi * 0.3 * n + rng.uniform(0, 2 * np.pi))
+    x += rng.normal(0, noise, nSamples)
+    return x * amplitude
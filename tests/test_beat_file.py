@@ -0,0 +1,62 @@
+import numpy as np
+
+import beat_file
+
+
+def details(n_pairs, n_missed, n_extra, seed):
+    rng = np.random.default_rng(seed)
+    return {"anno_index" : np.arange(n_pairs),
+            "det_index" : np.arange(n_pairs) + 1,
+            "offset" : rng.integers(-10, 10, n_pairs),
+            "missed" : rng.integers(0, 100, n_missed),
+            "extra" : rng.integers(0, 100, n_extra)}
+
+
+def write(filename, tasks):
+    w = beat_file.BeatWriter(filename)
+    for i, task in enumerate(tasks):
+        w.write(task, details(i * 7 + 3, i, 2 * i, i))
+    return w
+
+
+def check(beats, tasks):
+    assert sorted(beats.keys()) == sorted(tasks)
+    for i, task in enumerate(tasks):
+        expected = details(i * 7 + 3, i, 2 * i, i)
+        d = beats.get(*task)
+        for name in expected:
+            assert d[name].dtype == np.int32
+            np.testing.assert_array_equal(d[name], expected[name])
+
+
+tasks = [("swt_detector", "einthoven_ii", "sitting", s) for s in range(5)]
+
+
+def test_roundtrip(tmp_path):
+    filename = str(tmp_path / "beats.bin")
+    write(filename, tasks).close()
+    beats = beat_file.BeatFile(filename)
+    check(beats, tasks)
+    assert beats.get("swt_detector", "einthoven_ii", "jogging", 0) is None
+
+
+def test_killed_run_without_index(tmp_path):
+    # records are synced when they are written but the index is missing
+    filename = str(tmp_path / "beats.bin")
+    w = write(filename, tasks)
+    check(beat_file.BeatFile(filename), tasks)
+    w.f.close()
+
+
+def test_cut_off_record_and_resume(tmp_path):
+    filename = str(tmp_path / "beats.bin")
+    w = write(filename, tasks)
+    w.f.truncate(w.f.tell() - 10)
+    w.f.close()
+    check(beat_file.BeatFile(filename), tasks[:-1])
+
+    # a resumed run appends to the complete records
+    w = beat_file.BeatWriter(filename)
+    w.write(tasks[-1], details(4 * 7 + 3, 4, 8, 4))
+    w.close()
+    check(beat_file.BeatFile(filename), tasks)
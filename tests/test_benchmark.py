@@ -0,0 +1,19 @@
+import benchmark
+
+
+def test_gather_keeps_subject_positions():
+    done = {("det", "einthoven_ii", "sitting", 0) : {"jmx" : 0},
+            # subject 1 failed (not in done)
+            ("det", "einthoven_ii", "sitting", 2) : {"jmx" : 2},
+            ("det", "einthoven_ii", "sitting", 3) : None, # no annotations
+            ("det", "einthoven_ii", "sitting", 4) : {"jmx" : 4}} # no cost
+    results = benchmark.gather(done, ["det"], ["jmx", "cost"], ["einthoven_ii"], ["sitting"], range(5))
+    assert results[("jmx", "det")]["einthoven_ii"]["sitting"] == [0, None, 2, 4]
+    assert results[("cost", "det")]["einthoven_ii"]["sitting"] == [None, None, None, None]
+
+
+def test_checkpoint_per_detector_selection():
+    scores = {"jmx" : None, "sens" : None}
+    assert benchmark.checkpoint_file(scores, ["a", "b"]) == benchmark.checkpoint_file(scores, ["b", "a"])
+    assert benchmark.checkpoint_file(scores, ["a", "b"]) != benchmark.checkpoint_file(scores, ["a", "c"])
+    assert benchmark.checkpoint_file(scores, ["a"]).endswith("checkpoint_jmx_sens_a.jsonl")
@@ -0,0 +1,23 @@
+from checkpoint import Checkpoint
+
+
+def test_torn_last_line(tmp_path):
+    filename = str(tmp_path / "checkpoint.jsonl")
+    ckpt = Checkpoint(filename)
+    ckpt.append(("swt_detector", "einthoven_ii", "sitting", 0), {"jmx" : 1})
+    ckpt.append(("swt_detector", "einthoven_ii", "sitting", 1), {"jmx" : 2})
+    ckpt.close()
+
+    # a crash while the last line was written
+    with open(filename,"r+") as f:
+        f.truncate(len(f.read()) - 10)
+
+    ckpt = Checkpoint(filename)
+    assert len(ckpt) == 1
+    ckpt.append(("swt_detector", "einthoven_ii", "sitting", 2), {"jmx" : 3})
+    ckpt.close()
+
+    ckpt = Checkpoint(filename)
+    assert set(ckpt.done) == {("swt_detector", "einthoven_ii", "sitting", 0),
+                              ("swt_detector", "einthoven_ii", "sitting", 2)}
+    assert ckpt.done[("swt_detector", "einthoven_ii", "sitting", 2)] == {"jmx" : 3}
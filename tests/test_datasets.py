@@ -0,0 +1,10 @@
+import pytest
+
+import datasets
+
+
+def test_synthetic_unknown_lead():
+    dataset = datasets.Synthetic(n_subjects = 1, duration = 5)
+    assert dataset.load(0, dataset.experiments[0], dataset.leads[1])[0] is not None
+    with pytest.raises(ValueError, match = "Unknown lead: one_lead"):
+        dataset.load(0, dataset.experiments[0], "one_lead")
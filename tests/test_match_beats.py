@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import jmx_analysis
+
+
+def nearest_diff_reference(annotation, nearest_match):
+    # the original quadratic nearest_diff, extended to also return the
+    # missed annotations and the extra detections
+    len_annotation=len(annotation)
+    if len(nearest_match) == 0:
+        return [], list(range(len_annotation)), []
+
+    used_indices=[]
+    for i in range(len_annotation):
+        diff = nearest_match - annotation[i]
+        index = np.abs(diff).argmin()
+        used_indices.append((index,np.abs(nearest_match[index]-annotation[i]),i))
+
+    unique_diffs=[]
+    index_used=[]
+    anno_used=[]
+    for j in used_indices:
+        if not (j[0] in index_used):
+            uni = []
+            for k in used_indices:
+                if k[0] == j[0]:
+                    uni.append(k)
+            i = np.argmin(uni,0)[1]
+            unique_diffs.append(uni[i][1])
+            index_used.append(j[0])
+            anno_used.append(uni[i][2])
+
+    missed = [i for i in range(len_annotation) if i not in anno_used]
+    extra = [i for i in range(len(nearest_match)) if i not in index_used]
+    return unique_diffs, missed, extra
+
+
+def check(annotation, detection):
+    annotation = np.asarray(annotation, dtype=np.int64)
+    detection = np.asarray(detection, dtype=np.int64)
+    diffs, missed, extra = nearest_diff_reference(annotation, detection)
+    anno_index, det_index, d, m, x = jmx_analysis.match_beats(annotation, detection)
+    np.testing.assert_array_equal(d, diffs)
+    np.testing.assert_array_equal(m, missed)
+    np.testing.assert_array_equal(x, extra)
+    np.testing.assert_array_equal(jmx_analysis.nearest_diff(annotation, detection), diffs)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random(seed):
+    rng = np.random.default_rng(seed)
+    n_anno = rng.integers(0, 40)
+    n_det = rng.integers(0, 40)
+    # small ranges give duplicates and ties
+    span = rng.choice([20, 200, 5000])
+    annotation = np.sort(rng.integers(0, span, n_anno))
+    detection = np.sort(rng.integers(0, span, n_det))
+    check(annotation, detection)
+
+
+@pytest.mark.parametrize("annotation, detection", [
+    ([], []),
+    ([], [1, 2, 3]),
+    ([1, 2, 3], []),
+    ([5, 5, 5], [5]), # duplicate annotations
+    ([10, 20], [15, 15, 15]), # duplicate detections and a tie
+    ([100, 200, 300], [1, 2, 3]), # annotations after all detections
+    ([1, 2, 3], [100, 200, 300]), # annotations before all detections
+    ([0, 10, 20, 30], [-50, 5, 25, 1000]), # detections out of the range of the annotations
+])
+def test_edge_cases(annotation, detection):
+    check(annotation, detection)
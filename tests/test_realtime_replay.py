@@ -0,0 +1,13 @@
+import benchmark
+import datasets
+import realtime_replay
+
+
+def test_nothing_replayed(monkeypatch):
+    monkeypatch.setattr(benchmark, "dataset", datasets.Synthetic(n_subjects = 1, duration = 10))
+    latency, chunk_times, errors, n_anno = realtime_replay.replay_detector(
+        ("none", lambda data: []), ["einthoven_ii"], ["sitting"], [])
+    assert len(latency) == 0 and len(chunk_times) == 0
+    s = realtime_replay.summary(latency, chunk_times, errors, n_anno)
+    assert s["chunk_time_median"] is None and s["realtime"] is None
+    realtime_replay.print_summary({"none" : s})
@@ -0,0 +1,19 @@
+import json
+
+import results_store
+
+
+def write_json(tmp_path, results):
+    with open(str(tmp_path)+"/sens_det.json","w") as f:
+        f.write(json.dumps({"einthoven_ii" : {"sitting" : results}}))
+
+
+def test_json_positions_are_subjects(tmp_path, monkeypatch):
+    monkeypatch.setattr(results_store, "resultsdir", str(tmp_path))
+    write_json(tmp_path, [[1, 10, 0, 0], None, [0.5, 5, 5, 5]]) # subject 11 failed
+    rows = results_store.rows_from_json("sens", ["det"], [10, 11, 12])
+    assert [row[3] for row in rows] == [10, 12]
+    # named records (WFDB) by their position as in benchmark.save
+    rows = results_store.rows_from_json("sens", ["det"], ["100", "101", "102"])
+    assert [row[3] for row in rows] == [0, 2]
+    assert [results_store.subject_key(["100", "101", "102"], s) for s in ("100", "102")] == [0, 2]
@@ -0,0 +1,39 @@
+import json
+
+import benchmark
+import datasets
+import detection_cache
+import results_store
+import scheduler
+
+
+class FailingSynthetic(datasets.Synthetic):
+    """Synthetic dataset where one subject can't be loaded."""
+    name = "failing_synthetic"
+
+    def load(self, subject_number, experiment, lead):
+        if subject_number == 1:
+            raise IOError("network hiccup")
+        return super().load(subject_number, experiment, lead)
+
+
+def every_second(data):
+    return list(range(0, len(data), 250))
+
+
+def test_failed_load_in_the_arena(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(detection_cache, "enabled", False)
+    for name in ("dataset", "fs", "resultsdir"): # restored after the test
+        monkeypatch.setattr(benchmark, name, getattr(benchmark, name))
+    monkeypatch.setattr(results_store, "resultsdir", results_store.resultsdir)
+    benchmark.use_dataset(FailingSynthetic(n_subjects = 3, duration = 10))
+    detector_list = [("every second", every_second)]
+
+    failed = scheduler.run(detector_list, {"sens" : benchmark.score_sensitivity},
+                           leads = ["einthoven_ii"], experiments = ["sitting"], jobs = 2, shared = True)
+
+    assert [task[3] for task in failed] == [1]
+    with open(benchmark.resultsdir+"/sens_every_second.json") as f:
+        results = json.loads(f.read())["einthoven_ii"]["sitting"]
+    assert len(results) == 3 and results[1] is None and results[0] is not None
@@ -0,0 +1,31 @@
+import aggregate
+import sequential_screening
+
+
+def detector(name):
+    def detect(data):
+        return []
+    detect.__name__ = name
+    return (name, detect)
+
+
+def test_race_ranks_are_consecutive():
+    condition = ("einthoven_ii", "sitting")
+    values = {"best" : [99, 98, 99, 100, 99, 98],
+              "good" : [98, 99, 98, 99, 100, 99],
+              "bad1" : [60, 61, 59, 60, 61, 60],
+              "bad2" : [50, 51, 49, 50, 51, 50],
+              "bad3" : [60, 61, 59, 60, 61, 60]} # same mean as bad1
+    detectors = [detector(name) for name in values]
+    running = {}
+    for name, v in values.items():
+        running[name, condition] = aggregate.RunningStats(quantiles = ())
+        for x in v:
+            running[name, condition].add(x)
+
+    active = list(detectors)
+    results = []
+    sequential_screening.settle_race(condition, active, running, results, 0.01)
+
+    assert [d[0] for d in active] == ["best", "good"]
+    assert [(r["detector"], r["rank"]) for r in results] == [("bad1", 3), ("bad3", 4), ("bad2", 5)]
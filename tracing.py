@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Tracing of the benchmark stages
+===============================
+Opt-in timing of the stages of every task (loading, lead filtering, the
+detector, the scoring steps, writing the results) in every process:
+
+    with tracing.stage("detector", detector = name):
+        ...
+
+Nothing is recorded unless enable() has been called; a disabled stage
+costs one function call. The events of the worker processes are sent
+back with their results (collect()/add()) so the main process can
+export all of them:
+
+export(filename): Chrome trace-event JSON (chrome://tracing or
+    https://ui.perfetto.dev) with one row per process and thread.
+print_summary(): the hottest stages by their self time (the time not
+    spent in nested stages).
+
+With enable(profile=directory) every task also runs under cProfile and
+its stats are stored as <directory>/<task>.prof (snakeviz, flameprof or
+pstats).
+"""
+
+import os
+import json
+import time
+import cProfile
+import threading
+import contextlib
+
+enabled = False
+profiledir = None # directory of the cProfile stats of the tasks (None: off)
+events = [] # Chrome trace events ("X": complete events, times in us)
+
+no_stage = contextlib.nullcontext()
+
+
+class Stage:
+
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        events.append({"name" : self.name, "ph" : "X", "ts" : self.start / 1E3,
+                       "dur" : (end - self.start) / 1E3, "pid" : os.getpid(),
+                       "tid" : threading.get_ident(), "args" : self.args})
+
+
+def stage(name, **args):
+    """Context manager which records the time spent in a stage."""
+    if not enabled:
+        return no_stage
+    return Stage(name, args)
+
+
+@contextlib.contextmanager
+def task(name, **args):
+    """Stage of a whole task which is also profiled if profiling is on."""
+    if not enabled:
+        yield
+        return
+    with stage("task", task = name, **args):
+        if profiledir is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            os.makedirs(profiledir, exist_ok=True)
+            profile.dump_stats(os.path.join(profiledir, name + ".prof"))
+
+
+def enable(profile = None):
+    """Starts recording. profile: directory for the cProfile stats of every task."""
+    global enabled, profiledir
+    enabled = True
+    profiledir = profile
+
+
+def settings():
+    """The settings to be passed on to the worker processes."""
+    return enabled, profiledir
+
+
+def configure(s):
+    """Settings of the parent process; a forked worker drops the events it inherited."""
+    global enabled, profiledir, events
+    enabled, profiledir = s
+    events = []
+
+
+def collect():
+    """Returns and clears the recorded events (of a worker)."""
+    global events
+    e = events
+    events = []
+    return e
+
+
+def add(e):
+    """Adds the events of a worker."""
+    events.extend(e)
+
+
+def export(filename):
+    """Writes the events as Chrome trace-event JSON."""
+    with open(filename,"w") as f:
+        f.write(json.dumps({"traceEvents" : events, "displayTimeUnit" : "ms"}, default=str))
+
+
+def self_times(e = None):
+    """Dict stage -> (count, total time, self time) in s."""
+    if e is None:
+        e = events
+    result = {}
+    threads = {}
+    for event in e:
+        threads.setdefault((event["pid"], event["tid"]), []).append(event)
+    for thread in threads.values():
+        # parents start before (or with) their children and end after them
+        thread.sort(key = lambda event: (event["ts"], -event["dur"]))
+        stack = [] # [event, time of its children]
+        def close(entry):
+            count, total, own = result.get(entry[0]["name"], (0, 0.0, 0.0))
+            result[entry[0]["name"]] = (count + 1, total + entry[0]["dur"] / 1E6,
+                                        own + (entry[0]["dur"] - entry[1]) / 1E6)
+        for event in thread:
+            while stack and stack[-1][0]["ts"] + stack[-1][0]["dur"] <= event["ts"]:
+                close(stack.pop())
+            if stack:
+                stack[-1][1] += event["dur"]
+            stack.append([event, 0.0])
+        while stack:
+            close(stack.pop())
+    return result
+
+
+def print_summary(e = None, n = 20):
+    """Table of the n stages with the highest self time."""
+    times = self_times(e)
+    traced = sum(own for count, total, own in times.values())
+    print("{:30s} {:>8s} {:>10s} {:>10s} {:>10s} {:>7s}".format(
+        "stage", "count", "self (s)", "total (s)", "mean (ms)", "self %"))
+    for name, (count, total, own) in sorted(times.items(), key = lambda t: -t[1][2])[:n]:
+        print("{:30s} {:8d} {:10.3f} {:10.3f} {:10.3f} {:6.1f}%".format(
+            name, count, own, total, total / count * 1E3, own / traced * 100 if traced > 0 else 0))
@@ -1,21 +1,110 @@
 import numpy as np
 
+
+class StreamingMedian:
+    """
+    Exact running median and median absolute deviation of non-negative
+    integers (for example distances in samples) which keeps only a
+    histogram of the values seen so far.
+    Memory is bounded by the largest value and not by the number of values.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.n = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.int64).ravel()
+        if len(values) == 0:
+            return
+        c = np.bincount(values)
+        if len(c) > len(self.counts):
+            c[:len(self.counts)] += self.counts
+            self.counts = c
+        else:
+            self.counts[:len(c)] += c
+        self.n += len(values)
+
+    def median(self):
+        # same as np.median: the mean of the two middle values
+        if self.n == 0:
+            return np.nan
+        cs = np.cumsum(self.counts)
+        lo = np.searchsorted(cs, (self.n - 1) // 2, side='right')
+        hi = np.searchsorted(cs, self.n // 2, side='right')
+        return (lo + hi) / 2
+
+    def mad(self):
+        # median absolute deviation from the median (unscaled)
+        if self.n == 0:
+            return np.nan
+        med = self.median()
+        values = np.flatnonzero(self.counts)
+        dev = np.abs(values - med)
+        order = np.argsort(dev, kind='stable')
+        cs = np.cumsum(self.counts[values][order])
+        lo = dev[order][np.searchsorted(cs, (self.n - 1) // 2, side='right')]
+        hi = dev[order][np.searchsorted(cs, self.n // 2, side='right')]
+        return (lo + hi) / 2
+
+
+def segmentMedian(values, segments, n_segments):
+    """
+    np.median of the values of every segment (0..n_segments-1) in one
+    sort instead of a loop over the segments. NaN for empty segments.
+    """
+    order = np.lexsort((values, segments))
+    v = values[order]
+    counts = np.bincount(segments, minlength=n_segments)
+    start = np.r_[0, np.cumsum(counts)[:-1]]
+    lo = np.minimum(start + (counts - 1) // 2, max(len(v) - 1, 0))
+    hi = np.minimum(start + counts // 2, max(len(v) - 1, 0))
+    median = np.full(n_segments, np.nan)
+    ok = counts > 0
+    median[ok] = (v[lo[ok]] + v[hi[ok]]) / 2
+    return median
+
+
+def nearestDistance(detected_peaks, anno, anno_sorted=False):
+    """
+    Absolute distance of every detected peak to its nearest annotation.
+    The annotations are sorted once and then searched for all peaks.
+    """
+    if not anno_sorted:
+        anno = np.sort(np.asarray(anno))
+    detected_peaks = np.asarray(detected_peaks)
+    right = np.minimum(np.searchsorted(anno, detected_peaks), len(anno) - 1)
+    left = np.maximum(right - 1, 0)
+    return np.minimum(np.abs(detected_peaks - anno[left]), np.abs(detected_peaks - anno[right]))
+
+
 """
 From the detected R peaks the function works itself backwards to
 calculate the median delay the detector introduces. This is used
 for benchmarking to compensate for different delays the detctors
 introduce.
+max_peaks: only use an evenly spaced subsample of this many peaks
+chunk_size: process the peaks in chunks of this size and keep only
+a histogram of the distances (exact median with bounded memory)
 """
-def calcMedianDelay(detected_peaks, anno):
+def calcMedianDelay(detected_peaks, anno, max_peaks=None, chunk_size=None):
+
+    detected_peaks = np.asarray(detected_peaks)
 
-    r_peaks = []
+    if max_peaks is not None and len(detected_peaks) > max_peaks:
+        step = int(np.ceil(len(detected_peaks) / max_peaks))
+        detected_peaks = detected_peaks[::step]
 
-    for i in detected_peaks:
-        d = np.abs(i-anno)
-        ii = np.argmin(d)
-        r_peaks.append(d[ii])
+    if chunk_size is None:
+        m = int(np.median(nearestDistance(detected_peaks, anno)))
+        return m
 
-    m = int(np.median(r_peaks))
+    anno = np.sort(np.asarray(anno))
+    median = StreamingMedian()
+    for i in range(0, len(detected_peaks), chunk_size):
+        median.add(nearestDistance(detected_peaks[i:i+chunk_size], anno, anno_sorted=True))
+
+    m = int(median.median())
     return m
 
 
@@ -23,10 +112,14 @@ def trim_after_detection(detections, annotations, start_index, end_index):
 
     # start_index = annotated index to start at after trimming
     # end_index = annotated index to end at after trimming
+    # The detections need to be in ascending order as the detectors return
+    # them. Both trimmed arrays are views (no copies).
     det_start_posn=int((annotations[start_index]+annotations[start_index-1])/2) # allow for detection half interval before start point annotation
     det_end_posn=int((annotations[end_index]+annotations[end_index+1])/2) # allow for detection half interval after end point annotation
-    
+
     annotations_trimmed=annotations[start_index:(end_index+1)] # trim annotations to match trimmed detections
-    detections_trimmed = detections[ (detections >= det_start_posn) & (detections <= det_end_posn) ] # remove detections with positions outwith range
-    
+    first = np.searchsorted(detections, det_start_posn, side='left') # first detection >= det_start_posn
+    last = np.searchsorted(detections, det_end_posn, side='right') # one after the last detection <= det_end_posn
+    detections_trimmed = detections[first:last] # remove detections with positions outwith range
+
     return detections_trimmed, annotations_trimmed